@@ -13,7 +13,7 @@
 
 from xng.application import ScApplication
 from dbus.mainloop.glib import DBusGMainLoop
-from gi.repository import GObject, Gdk
+from gi.repository import GObject
 import gettext
 import sys
 
@@ -36,7 +36,6 @@ def main():
 
     DBusGMainLoop(set_as_default=True)
     GObject.threads_init()
-    Gdk.threads_init()
     app = ScApplication()
     app.run(sys.argv)
 
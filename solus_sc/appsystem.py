@@ -13,6 +13,7 @@
 
 from gi.repository import AppStream as As
 from gi.repository import Gio, GLib, GdkPixbuf, Gtk
+from .icon_cache import ScScaledIconCache
 from .media_fetcher import ScMediaFetcher
 
 
@@ -93,13 +94,19 @@ class AppSystem:
     other_pixbuf = None
     addon_pixbuf = None
     fetcher = None
+    icon_cache = None
+
+    # Lookup table over the pool components
+    pkgname_index = None
 
     def __init__(self):
         self.fetcher = ScMediaFetcher()
+        self.icon_cache = ScScaledIconCache()
         self.pool = As.Pool()
         self.pool.set_flags(As.PoolFlags.LOAD_OS_CATALOG)
         self.pool.load()
         self.components = self.pool.get_components()
+        self.build_index()
 
         itheme = Gtk.IconTheme.get_default()
         try:
@@ -135,15 +142,36 @@ class AppSystem:
     def sanitize(self, text):
         return text.replace("&quot;", "\"")
 
-    def get_app_by_pkgname(self, package_name):
+    def build_index(self):
+        """ Index the pool components by package name once, so that
+            lookups don't have to walk every component """
+        self.pkgname_index = dict()
         for component in self.components.as_array():
-            if component.get_pkgname() == package_name:
-                return component
-        return None
+            pkgname = component.get_pkgname()
+            if pkgname:
+                self.pkgname_index.setdefault(pkgname, component)
+
+    def get_app_by_pkgname(self, package_name):
+        return self.pkgname_index.get(package_name)
+
+    def resolve_packages(self, packages):
+        """ Resolve the components for a list of packages in one go,
+            returning a dict of package name to component (or None) """
+        ret = dict()
+        for package in packages:
+            name = str(package.name)
+            ret[name] = self.pkgname_index.get(name)
+        return ret
+
+    def _resolve(self, package, app):
+        """ Use a component from resolve_packages if we have one """
+        if app is not None:
+            return app
+        return self.get_app_by_pkgname(package.name)
 
-    def get_summary(self, package):
+    def get_summary(self, package, app=None):
         """ Return a usable summary for a package """
-        app = self.get_app_by_pkgname(package.name)
+        app = self._resolve(package, app)
         ret = None
         if not app:
             ret = GLib.markup_escape_text(str(package.summary))
@@ -151,9 +179,9 @@ class AppSystem:
             ret = app.get_summary()
         return self.sanitize(ret)
 
-    def get_search_summary(self, package):
+    def get_search_summary(self, package, app=None):
         """ Return a usable search summary for a package """
-        app = self.get_app_by_pkgname(package.name)
+        app = self._resolve(package, app)
         ret = None
         if not app:
             summary = str(package.summary)
@@ -162,9 +190,9 @@ class AppSystem:
         summary = summary.replace(" & ", " &amp; ")
         return GLib.markup_escape_text(summary)
 
-    def get_description(self, package):
+    def get_description(self, package, app=None):
         """ Return a usable description for a package """
-        app = self.get_app_by_pkgname(package.name)
+        app = self._resolve(package, app)
         description = str(package.description)
         if not app:
             return self.sanitize(
@@ -175,8 +203,8 @@ class AppSystem:
                 GLib.markup_escape_text(description))
         return c
 
-    def get_name(self, package):
-        app = self.get_app_by_pkgname(package.name)
+    def get_name(self, package, app=None):
+        app = self._resolve(package, app)
         if not app:
             return GLib.markup_escape_text(str(package.name))
         return GLib.markup_escape_text(self.sanitize(app.get_pkgname()))
@@ -187,9 +215,9 @@ class AppSystem:
             return package.icon
         return "package-x-generic"
 
-    def get_pixbuf(self, package):
+    def get_pixbuf(self, package, app=None):
         """ Get the AppStream GdkPixbuf for a package """
-        app = self.get_app_by_pkgname(package.name)
+        app = self._resolve(package, app)
         if not app:
             return None
         # TODO: Incorporate HIDPI!
@@ -205,8 +233,7 @@ class AppSystem:
             return im
         icon_filename = icon.get_filename()
         try:
-            pixbuf = GdkPixbuf.Pixbuf.new_from_file(icon_filename)
-            return pixbuf
+            return self.icon_cache.load(icon_filename, 64)
         except Exception as e:
             print(e)
         return icon.get_pixbuf()
@@ -220,9 +247,9 @@ class AppSystem:
             return self.addon_pixbuf
         return self.default_pixbuf
 
-    def get_pixbuf_only(self, package):
+    def get_pixbuf_only(self, package, app=None):
         """ Only get a pixbuf - no fallbacks  """
-        app = self.get_app_by_pkgname(package.name)
+        app = self._resolve(package, app)
         if not app:
             return self.default_pixbuf_lookup(app)
         # TODO: Incorporate HIDPI!
@@ -249,8 +276,7 @@ class AppSystem:
             return self.default_pixbuf
         icon_filename = icon.get_filename()
         try:
-            pixbuf = GdkPixbuf.Pixbuf.new_from_file(icon_filename)
-            return pixbuf
+            return self.icon_cache.load(icon_filename, 64)
         except Exception as e:
             print(e)
         pbuf = icon.get_pixbuf()
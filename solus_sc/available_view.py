@@ -44,10 +44,11 @@ class ScAvailableView(ScPackagesView):
         if len(packages) >= 40:
             self.reset()
 
-        for pkg_name in packages:
-            pkg = self.basket.packagedb.get_package(pkg_name)
+        packages = [self.basket.packagedb.get_package(x) for x in packages]
+        apps = self.appsystem.resolve_packages(packages)
 
-            model.append(self.get_pkg_model(pkg))
+        for pkg in packages:
+            model.append(self.get_pkg_model(pkg, apps[pkg.name]))
 
             while (Gtk.events_pending()):
                 Gtk.main_iteration()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2013-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 2 of the License, or
+#  (at your option) any later version.
+#
+
+from gi.repository import GdkPixbuf
+import os
+import threading
+import time
+
+TEMP_SUFFIX = ".tmp"
+
+# Leave younger temporary files alone, they may still be being written
+TEMP_MIN_AGE = 60 * 60
+
+
+def get_icon_cache_dir():
+    """ Return the per-user location of the pre-scaled icons """
+    home = os.path.expanduser("~")
+    return os.path.join(home, ".cache", "solus-sc", "icons")
+
+
+class ScScaledIconCache:
+    """ ScScaledIconCache keeps AppStream icons on disk already scaled to
+        the sizes we display them at, so we only ever resample an icon once
+        rather than on every render of every launch.
+
+        Each size mirrors the source paths in its own directory, and every
+        entry carries the mtime of its source. An updated icon is therefore
+        rescaled over its old entry, and entries whose source has gone or
+        changed are pruned in the background when the cache is created.
+    """
+
+    cache_dir = None
+
+    def __init__(self):
+        self.cache_dir = get_icon_cache_dir()
+        try:
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir, 00755)
+        except Exception as e:
+            print("Check home directory permissions for {}: {}".format(
+                self.cache_dir, e))
+
+        t = threading.Thread(target=self.prune)
+        t.daemon = True
+        t.start()
+
+    def get_cache_path(self, source, size):
+        """ Return the cache path for source at size """
+        source = os.path.abspath(source).lstrip(os.sep)
+        return os.path.join(self.cache_dir, str(size), source)
+
+    def get_source_path(self, size_dir, path):
+        """ Inverse of get_cache_path """
+        return os.sep + os.path.relpath(path, size_dir)
+
+    def is_current(self, source, path):
+        """ Determine if the entry at path was made from source as it is
+            now """
+        try:
+            return int(os.stat(path).st_mtime) == \
+                int(os.stat(source).st_mtime)
+        except OSError:
+            return False
+
+    def has_icon(self, source, size):
+        return self.is_current(source, self.get_cache_path(source, size))
+
+    def load(self, source, size):
+        """ Return a pixbuf of source scaled to size, scaling and storing it
+            first if we haven't already done so """
+        path = self.get_cache_path(source, size)
+        if self.is_current(source, path):
+            try:
+                return GdkPixbuf.Pixbuf.new_from_file(path)
+            except Exception as e:
+                print("Discarding scaled icon {}: {}".format(path, e))
+
+        pbuf = GdkPixbuf.Pixbuf.new_from_file(source)
+        if pbuf.get_width() == size and pbuf.get_height() == size:
+            return pbuf
+        pbuf = pbuf.scale_simple(size, size, GdkPixbuf.InterpType.BILINEAR)
+        self.store(source, path, pbuf)
+        return pbuf
+
+    def store(self, source, path, pbuf):
+        """ Atomically write the scaled icon, stamped with the mtime of its
+            source """
+        tmp_path = path + TEMP_SUFFIX
+        try:
+            mtime = os.stat(source).st_mtime
+            parent = os.path.dirname(path)
+            if not os.path.exists(parent):
+                os.makedirs(parent, 00755)
+            pbuf.savev(tmp_path, "png", [], [])
+            os.utime(tmp_path, (mtime, mtime))
+            os.rename(tmp_path, path)
+        except Exception as e:
+            print("Unable to store scaled icon {}: {}".format(path, e))
+
+    def prune(self):
+        """ Remove entries whose source is gone or has changed, along with
+            abandoned temporary files and anything in an unknown layout """
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            if name.isdigit() and os.path.isdir(path):
+                self.prune_size(path)
+            elif os.path.isfile(path):
+                self.remove(path)
+
+    def prune_size(self, size_dir):
+        for root, dirs, files in os.walk(size_dir, topdown=False):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(TEMP_SUFFIX):
+                    try:
+                        age = time.time() - os.stat(path).st_mtime
+                    except OSError:
+                        continue
+                    if age >= TEMP_MIN_AGE:
+                        self.remove(path)
+                    continue
+                source = self.get_source_path(size_dir, path)
+                if not self.is_current(source, path):
+                    self.remove(path)
+            if root == size_dir:
+                continue
+            try:
+                os.rmdir(root)  # Only succeeds once empty
+            except OSError:
+                pass
+
+    def remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -46,10 +46,12 @@ class ScInstalledView(ScPackagesView):
         model = self.get_model()
         model.set_sort_column_id(1, Gtk.SortType.ASCENDING)
 
-        for pkg_name in self.basket.installdb.list_installed():
-            pkg = self.basket.installdb.get_package(pkg_name)
+        packages = [self.basket.installdb.get_package(x)
+                    for x in self.basket.installdb.list_installed()]
+        apps = self.appsystem.resolve_packages(packages)
 
-            model.append(self.get_pkg_model(pkg))
+        for pkg in packages:
+            model.append(self.get_pkg_model(pkg, apps[pkg.name]))
 
         self.tview.set_model(model)
         GLib.idle_add(self.finish_view)
@@ -126,18 +126,19 @@ class ScPackagesView(Gtk.VBox):
     def get_model():
         return Gtk.ListStore(str, str, GdkPixbuf.Pixbuf, str)
 
-    def get_pkg_model(self, pkg):
-        summary = self.appsystem.get_search_summary(pkg)
+    def get_pkg_model(self, pkg, app=None):
+        """ app is the optional component from resolve_packages """
+        summary = self.appsystem.get_search_summary(pkg, app)
         summary = render_plain(str(summary))
 
         if len(summary) > 76:
             summary = "%s…" % summary[0:76]
 
-        name = self.appsystem.get_name(pkg)
+        name = self.appsystem.get_name(pkg, app)
         p_print = "<b>%s</b> - %s\n%s" % (name, str(pkg.version),
                                           summary)
 
-        pbuf = self.appsystem.get_pixbuf_only(pkg)
+        pbuf = self.appsystem.get_pixbuf_only(pkg, app)
 
         return [p_print, pkg.name, pbuf, "go-next-symbolic"]
 
@@ -111,7 +111,7 @@ class ScSearchResults(ScPackagesView):
                                             srslt, cutoff=0.5)
         packages = leaders
         packages.extend(sorted([x for x in srslt if x not in leaders]))
-        added = False
+        results = []
         for pkg_name in packages:
             if self.basket.packagedb.has_package(pkg_name):
                 pkg = self.basket.packagedb.get_package(pkg_name)
@@ -121,10 +121,13 @@ class ScSearchResults(ScPackagesView):
             # Always hide debug packages
             if is_package_debug(pkg) and "dbg" not in term:
                 continue
+            results.append(pkg)
 
-            added = True
+        added = len(results) > 0
+        apps = self.appsystem.resolve_packages(results)
 
-            model.append(self.get_pkg_model(pkg))
+        for pkg in results:
+            model.append(self.get_pkg_model(pkg, apps[pkg.name]))
 
             while (Gtk.events_pending()):
                 Gtk.main_iteration()
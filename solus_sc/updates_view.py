@@ -377,6 +377,7 @@ class ScUpdatesView(Gtk.VBox):
             Gdk.threads_leave()
             return False
 
+        candidates = []
         for item in sorted(upgrades):
 
             old_item = item
@@ -388,6 +389,13 @@ class ScUpdatesView(Gtk.VBox):
                 item = replc[item][0]
 
             new_pkg = self.packagedb.get_package(item)
+            candidates.append((old_item, item, new_pkg))
+
+        # Resolve all AppStream components up front
+        apps = self.appsystem.resolve_packages([x[2] for x in candidates])
+
+        for old_item, item, new_pkg in candidates:
+            app = apps[new_pkg.name]
             new_version = "%s-%s" % (str(new_pkg.version),
                                      str(new_pkg.release))
             pkg_name = str(new_pkg.name)
@@ -411,9 +419,9 @@ class ScUpdatesView(Gtk.VBox):
             pkgSize = sc_obj.get_update_size()
             dlSize = sc_format_size_local(pkgSize)
 
-            icon = self.appsystem.get_pixbuf_only(new_pkg)
+            icon = self.appsystem.get_pixbuf_only(new_pkg, app)
 
-            pkg_name = self.appsystem.get_name(new_pkg)
+            pkg_name = self.appsystem.get_name(new_pkg, app)
             summary = GLib.markup_escape_text(summary)
 
             if old_item != item:
@@ -3,5 +3,6 @@
 #pep8 solus_sc/*.py solus_update/*.py solus-sc solus-update-checker eopkg_assist/*.py || exit 1
 #flake8 --builtins="_" solus_sc/*.py solus_update/*.py solus-sc solus-update-checker eopkg_assist/*.py || exit 1
 
-pycodestyle xng/*.py xng/plugins/*.py xng/plugins/eopkg/*.py  xng/plugins/flatpak/*.py xng/util/*.py new.py || exit 1
-flake8 --builtins="_" xng/*.py xng/plugins/*.py xng/plugins/eopkg/*.py xng/plugins/flatpak/*.py xng/util/*.py new.py || exit 1
+pycodestyle xng/*.py xng/plugins/*.py xng/plugins/eopkg/*.py  xng/plugins/flatpak/*.py xng/util/*.py tests/*.py new.py || exit 1
+flake8 --builtins="_" xng/*.py xng/plugins/*.py xng/plugins/eopkg/*.py xng/plugins/flatpak/*.py xng/util/*.py tests/*.py new.py || exit 1
+python2 -m unittest discover -s tests || exit 1
@@ -0,0 +1,207 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2013-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 2 of the License, or
+#  (at your option) any later version.
+#
+
+import BaseHTTPServer
+import SocketServer
+import imp
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+# Load the module directly, the xng package itself requires GTK
+downloader = imp.load_source(
+    "downloader", os.path.join(os.path.dirname(__file__), "..",
+                               "xng", "util", "downloader.py"))
+
+BODY = "x" * 100000
+ETAG = '"v1"'
+
+
+class FixtureHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Serves a single resource with an ETag, a redirect to it, and a
+        resource that breaks off halfway through its body """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.client_address))
+            server.conditional.append(
+                self.headers.getheader("If-None-Match"))
+
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/image.png")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path == "/image.png":
+            if self.headers.getheader("If-None-Match") == ETAG:
+                self.send_response(304)
+                self.send_header("ETag", ETAG)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", ETAG)
+            self.send_header("Content-Length", str(len(BODY)))
+            self.end_headers()
+            self.wfile.write(BODY)
+        elif self.path == "/truncated.png":
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(BODY)))
+            self.end_headers()
+            self.wfile.write(BODY[:len(BODY) / 2])
+            self.close_connection = 1
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+
+class FixtureServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0),
+                                           FixtureHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.conditional = []  # If-None-Match of each request
+
+    def handle_error(self, request, client_address):
+        """ Clients dropping kept-alive or cancelled connections are
+            expected, anything else is still reported """
+        if isinstance(sys.exc_info()[1], socket.error):
+            return
+        BaseHTTPServer.HTTPServer.handle_error(self, request,
+                                               client_address)
+
+    def get_connections(self):
+        """ Return the number of distinct client connections seen """
+        with self.lock:
+            return len(set(x[1] for x in self.requests))
+
+
+class Cancelled:
+    """ Stands in for an already cancelled Gio.Cancellable """
+
+    def is_cancelled(self):
+        return True
+
+
+class TestScDownloader(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FixtureServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base = "http://127.0.0.1:{}".format(self.server.server_port)
+        self.cache_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.cache_dir, "image.png")
+        self.downloader = downloader.ScDownloader()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def get_temp_files(self):
+        return [x for x in os.listdir(self.cache_dir)
+                if x.endswith(downloader.TEMP_SUFFIX)]
+
+    def test_download(self):
+        url = self.base + "/image.png"
+        self.assertTrue(self.downloader.fetch(url, self.path))
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), BODY)
+        meta = self.downloader.read_meta(self.path)
+        self.assertEqual(meta["etag"], ETAG)
+        self.assertTrue(self.downloader.is_fresh(self.path))
+
+    def test_fresh_skips_network(self):
+        url = self.base + "/image.png"
+        self.downloader.fetch(url, self.path)
+        self.assertFalse(self.downloader.fetch(url, self.path))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_revalidate(self):
+        url = self.base + "/image.png"
+        self.downloader.fetch(url, self.path)
+        self.assertFalse(self.downloader.fetch(url, self.path, force=True))
+        self.assertEqual(len(self.server.requests), 2)
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), BODY)
+
+    def test_discard(self):
+        url = self.base + "/image.png"
+        self.downloader.fetch(url, self.path)
+        self.downloader.discard(self.path)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertIsNone(self.downloader.read_meta(self.path))
+        self.assertFalse(self.downloader.is_fresh(self.path))
+
+        # Starts over with a full download rather than revalidating
+        self.assertTrue(self.downloader.fetch(url, self.path))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertIsNone(self.server.conditional[-1])
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), BODY)
+
+    def test_keep_alive(self):
+        url = self.base + "/image.png"
+        self.downloader.fetch(url, self.path)
+        self.downloader.fetch(url, self.path, force=True)
+        self.downloader.fetch(url, self.path + "2")
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.get_connections(), 1)
+
+    def test_redirect(self):
+        self.assertTrue(self.downloader.fetch(self.base + "/redirect",
+                                              self.path))
+        paths = [x[0] for x in self.server.requests]
+        self.assertEqual(paths, ["/redirect", "/image.png"])
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), BODY)
+
+    def test_not_found(self):
+        with self.assertRaises(IOError):
+            self.downloader.fetch(self.base + "/missing.png", self.path)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.get_temp_files(), [])
+
+    def test_truncated_leaves_no_temp(self):
+        with self.assertRaises(Exception):
+            self.downloader.fetch(self.base + "/truncated.png", self.path)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.get_temp_files(), [])
+
+    def test_cancelled_leaves_no_temp(self):
+        with self.assertRaises(downloader.DownloadCancelled):
+            self.downloader.fetch(self.base + "/image.png", self.path,
+                                  Cancelled())
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.get_temp_files(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,7 +12,11 @@
 #
 
 from gi.repository import AppStreamGlib as As
-from gi.repository import GLib, GdkPixbuf, Gtk, Gdk
+from gi.repository import GLib, Gtk
+from .util import appcache
+from .util import icons
+from .util.icons import ScIconService
+import threading
 
 
 class Screenshot:
@@ -22,35 +26,33 @@ class Screenshot:
     thumb_uri = None
     default = None
 
-    def __init__(self, asImg, scale):
+    def __init__(self, default, images, scale):
+        """ images is a list of (width, url) for the screenshot """
         large = None
         normal = None
         thumbnail = None
 
-        if asImg.get_kind() == As.ScreenshotKind.DEFAULT:
-            self.default = True
-        else:
-            self.default = False
+        self.default = default
 
         # Loop em all with scale factor
-        for image in asImg.get_images():
-            if image.get_width() == As.IMAGE_LARGE_WIDTH * scale:
+        for image in images:
+            if image[0] == As.IMAGE_LARGE_WIDTH * scale:
                 large = image
-            elif image.get_width() == As.IMAGE_NORMAL_WIDTH * scale:
+            elif image[0] == As.IMAGE_NORMAL_WIDTH * scale:
                 normal = image
-            elif image.get_width() == As.IMAGE_THUMBNAIL_WIDTH * scale:
+            elif image[0] == As.IMAGE_THUMBNAIL_WIDTH * scale:
                 thumbnail = image
             if large and normal and thumbnail:
                 break
         # Couldn't find with scale factor so try with normal sizes
         if scale != 1:
             if not thumbnail or not normal:
-                for image in asImg.get_images():
-                    if image.get_width() == As.IMAGE_LARGE_WIDTH:
+                for image in images:
+                    if image[0] == As.IMAGE_LARGE_WIDTH:
                         large = image
-                    elif image.get_width() == As.IMAGE_NORMAL_WIDTH:
+                    elif image[0] == As.IMAGE_NORMAL_WIDTH:
                         normal = image
-                    elif image.get_width() == As.IMAGE_THUMBNAIL_WIDTH:
+                    elif image[0] == As.IMAGE_THUMBNAIL_WIDTH:
                         thumbnail = image
                     if large and normal and thumbnail:
                         break
@@ -61,8 +63,81 @@ class Screenshot:
         if not normal or not thumbnail:
             raise RuntimeError("Invalid screenshot")
 
-        self.main_uri = large.get_url()
-        self.thumb_uri = thumbnail.get_url()
+        self.main_uri = large[1]
+        self.thumb_uri = thumbnail[1]
+
+
+class AppEntry:
+    """ AppEntry caches everything we resolve from a single AppStream app,
+        so that listing widgets never have to walk the store themselves.
+
+        Entries are built from flattened records, either straight from an
+        As.App or from the on-disk AppStream cache. The As.App itself is
+        only looked up if something asks for it.
+    """
+
+    record = None
+    app_ref = None
+    appsystem = None
+
+    id = None
+    pkgname = None
+    raw_name = None  # Untouched name, used for searching
+    name = None      # Sanitized + escaped name
+    summary = None   # Sanitized summary
+    keywords = None
+    desktop = False  # Whether this is a desktop application
+    icons = None     # Chosen icon per (size, scale factor)
+    icon_list = None
+
+    def __init__(self, appsystem, record, app=None):
+        self.appsystem = appsystem
+        self.record = record
+        self.app_ref = app
+        self.id = record[appcache.RECORD_ID]
+        pkgnames = record[appcache.RECORD_PKGNAMES]
+        if pkgnames:
+            self.pkgname = pkgnames[0]
+        self.raw_name = record[appcache.RECORD_NAME]
+        if self.raw_name:
+            self.name = GLib.markup_escape_text(
+                appsystem.sanitize(self.raw_name))
+        summary = record[appcache.RECORD_SUMMARY]
+        if summary:
+            self.summary = appsystem.sanitize(summary)
+        self.keywords = record[appcache.RECORD_KEYWORDS]
+        self.desktop = record[appcache.RECORD_DESKTOP]
+        self.icons = dict()
+
+    @property
+    def app(self):
+        """ The full As.App, which may mean loading the whole store """
+        if self.app_ref is None:
+            self.app_ref = self.appsystem.get_store().get_app_by_id(self.id)
+        return self.app_ref
+
+    def get_url(self, kind):
+        return self.record[appcache.RECORD_URLS].get(int(kind))
+
+    def get_description(self):
+        return self.record[appcache.RECORD_DESCRIPTION]
+
+    def get_developer(self):
+        return self.record[appcache.RECORD_DEVELOPER]
+
+    def get_launchable(self):
+        return self.record[appcache.RECORD_LAUNCHABLE]
+
+    def get_screenshots(self):
+        """ Return (default, [(width, url)]) for each screenshot """
+        return self.record[appcache.RECORD_SCREENSHOTS]
+
+    def get_icons(self):
+        """ Return As.Icon objects rebuilt from the cached fields """
+        if self.icon_list is None:
+            self.icon_list = [appcache.icon_from_record(x)
+                              for x in self.record[appcache.RECORD_ICONS]]
+        return self.icon_list
 
 
 class AppSystem:
@@ -72,76 +147,147 @@ class AppSystem:
         by hooking into AppSystem, and falling back to the native fields
         in the .eopkg's
 
+        The system AppStream data is served from ScAppStreamCache, and the
+        full As.Store is only parsed when the cache is stale or when
+        something needs a field we don't cache.
+
         TODO: Locale integration
     """
 
     store = None
-
-    store = None
+    store_lock = None
     fetcher = None
 
+    # Cached system metadata and its decoded entries
+    cache = None
+    cache_entries = None
+    entries = None  # Every entry for the system store
+
+    # Resolution tables for other stores, mapping IDs to AppEntry
+    tables = None
+
     scale_factor = 1
     window = None
+    icon_service = None
 
     def __init__(self):
-        self.store = As.Store()
-        self.store.load(As.StoreLoadFlags.APP_INFO_SYSTEM)
+        self.icon_service = ScIconService(self)
+        self.store_lock = threading.Lock()
+        self.tables = dict()
+        self.cache_entries = dict()
+        self.load_cache()
 
     def sanitize(self, text):
         return text.replace("&quot;", "\"")
 
+    def get_store(self):
+        """ Return the full system As.Store, parsing it on first use """
+        with self.store_lock:
+            if self.store is None:
+                store = As.Store()
+                store.load(As.StoreLoadFlags.APP_INFO_SYSTEM)
+                self.store = store
+        return self.store
+
+    def load_cache(self):
+        """ Map the AppStream cache, rebuilding it from the full store if
+            the system metadata has changed since it was written """
+        stamp = appcache.appstream_stamp()
+        path = appcache.get_appstream_cache_path()
+        try:
+            cache = appcache.ScAppStreamCache.open(path)
+            if cache.get_stamp() == stamp:
+                self.cache = cache
+                return
+        except Exception as e:
+            print("AppStream cache needs rebuilding: {}".format(e))
+
+        records = [appcache.record_from_app(x)
+                   for x in self.get_store().get_apps()]
+        self.cache = appcache.ScAppStreamCache.build(path, stamp, records)
+
+        # Metadata changed, so get the new icons scaled ahead of time
+        self.icon_service.prefill(records)
+
+    def get_cache_entry(self, index):
+        """ Decode a system entry once and keep it """
+        entry = self.cache_entries.get(index)
+        if entry is None:
+            entry = AppEntry(self, self.cache.get_record(index))
+            entry = self.cache_entries.setdefault(index, entry)
+        return entry
+
+    def build_table(self, store):
+        """ Resolve every app in a plugin's own store once """
+        apps = store.get_apps()
+        records = [appcache.record_from_app(x) for x in apps]
+        entries = [AppEntry(self, x, y) for x, y in zip(records, apps)]
+        keys = appcache.build_keys(records)
+        table = dict((x, entries[y]) for x, y in keys.items())
+        self.tables[store] = table
+        return table
+
+    def get_entries(self):
+        """ Return every resolved entry in the system store """
+        if self.entries is None:
+            self.entries = [self.get_cache_entry(x)
+                            for x in xrange(self.cache.count())]
+        return self.entries
+
+    def get_entry(self, store, id):
+        """ Return the AppEntry for the package, or None """
+        if not store or store == self.store:
+            index = self.cache.find(id)
+            if index < 0:
+                return None
+            return self.get_cache_entry(index)
+        table = self.tables.get(store)
+        if table is None:
+            table = self.build_table(store)
+        return table.get(id)
+
     def get_store_variant(self, store, id):
         """ Helper to find the package """
-        if not store:
-            store = self.store
-        ret = store.get_app_by_pkgname(id)
-        if ret:
-            return ret
-        ret = store.get_app_by_id(id)
-        if ret:
-            return ret
-        return store.get_app_by_id(id + ".desktop")
+        entry = self.get_entry(store, id)
+        if not entry:
+            return None
+        return entry.app
 
     def get_summary(self, id, fallback, store=None):
         """ Return a usable summary for a package """
-        app = self.get_store_variant(store, id)
-        ret = None
-        if not app:
-            ret = GLib.markup_escape_text(str(fallback))
-        else:
-            ret = app.get_comment("C")
-        if not ret:
+        entry = self.get_entry(store, id)
+        if not entry:
+            return self.sanitize(GLib.markup_escape_text(str(fallback)))
+        if not entry.summary:
             return self.sanitize(fallback)
-        return self.sanitize(ret)
+        return entry.summary
 
     def get_description(self, id, fallback, store=None):
         """ Return a usable description for a package """
-        app = self.get_store_variant(store, id)
-        if not app:
+        entry = self.get_entry(store, id)
+        if not entry:
             return self.sanitize(
                 GLib.markup_escape_text(str(fallback)))
-        c = app.get_description("C")
+        c = entry.get_description()
         if not c:
             return self.sanitize(
                 GLib.markup_escape_text(str(fallback)))
         return c
 
     def get_name(self, id, fallback, store=None):
-        app = self.get_store_variant(store, id)
-        if not app:
+        entry = self.get_entry(store, id)
+        if not entry:
             return GLib.markup_escape_text(str(fallback))
-        ret = app.get_name("C")
-        if not ret:
+        if not entry.name:
             return self.sanitize(fallback)
-        return GLib.markup_escape_text(self.sanitize(ret))
+        return entry.name
 
     def _get_appstream_url(self, id, ptype, store):
         """ Get an appstream link for the given package """
-        app = self.get_store_variant(store, id)
-        if not app:
+        entry = self.get_entry(store, id)
+        if not entry:
             return None
-        url = app.get_url_item(ptype)
-        return url
+        return entry.get_url(ptype)
 
     def get_website(self, id, fallback, store=None):
         """ Get the website for a given package """
@@ -152,27 +298,19 @@ class AppSystem:
             return str(fallback)
         return None
 
-    def find_icon(self, app, width, height):
-        """ AppStream will happily give us remote icons when we'll only look
-            to load locally sourced ones in the icon cache. It will also give
-            us remote ones before a locally existing one so we have to do
-            the iteration ourselves.
-        """
-        for icon in app.get_icons():
-            kind = icon.get_kind()
-            if kind == As.IconKind.UNKNOWN or kind == As.IconKind.REMOTE:
-                continue
-            iwidth = icon.get_width() / icon.get_scale()
-            iheight = icon.get_height() / icon.get_scale()
-            if iwidth == width and iheight == height:
-                return icon
-        return app.get_icon_for_size(width, height)
+    def find_icon(self, entry, width, height):
+        """ Find a locally usable icon for the entry at the given size """
+        return icons.find_icon(entry.get_icons(), width, height)
 
     def set_fallback_icon(self, image):
         image.set_from_icon_name("package-x-generic", Gtk.IconSize.INVALID)
 
     def set_image_from_item(self, image, item, store=None, size=64):
-        """ Set the GtkImage if possible """
+        """ Set the GtkImage if possible. AppStream icons are decoded in
+            the background, with a placeholder shown until they're ready """
+        # Forget any icon still being decoded for this image
+        image.sc_icon_key = None
+
         icon_name = item.get_icon_name()
         if icon_name:
             image.set_from_icon_name(icon_name, Gtk.IconSize.INVALID)
@@ -180,21 +318,21 @@ class AppSystem:
 
         # Grab app bits
         id = item.get_id()
-        app = self.get_store_variant(store, id)
+        entry = self.get_entry(store, id)
 
         # No app? Set default icon for hidpi support.
-        if not app:
+        if not entry:
             self.set_fallback_icon(image)
             return
 
-        size = size * self.scale_factor
-        original_size = size
+        original_size = size * self.scale_factor
 
-        # No icon?
-        icon = self.find_icon(app, size, size)
-        if not icon:
-            size /= self.scale_factor
-            icon = self.find_icon(app, size, size)
+        # No icon? Remember the choice so we only search once per size.
+        key = (original_size, self.scale_factor)
+        if key not in entry.icons:
+            entry.icons[key] = icons.choose_icon(
+                entry.get_icons(), size, self.scale_factor)
+        icon = entry.icons[key]
         if not icon:
             self.set_fallback_icon(image)
             return
@@ -210,45 +348,9 @@ class AppSystem:
             self.set_fallback_icon(image)
             return
 
-        icon.set_scale(self.scale_factor)
-        # Try to load the cached/available icon
-        try:
-            if not icon.load(As.IconLoadFlags.SEARCH_SIZE):
-                self.set_fallback_icon(image)
-                return
-        except Exception as e:
-            print("Should not happen: {}".format(e))
-            self.set_fallback_icon(image)
-            return
-
-        # At this point we're dealing with pixbufs
-        pbuf = icon.get_pixbuf()
-
-        # Ensure we upscale on HiDPI
-        if pbuf.get_height() != original_size:
-            pbuf = pbuf.scale_simple(
-                original_size,
-                original_size,
-                GdkPixbuf.InterpType.BILINEAR)
-
-        if self.scale_factor == 1:
-            image.set_from_pixbuf(pbuf)
-            return
-
-        window = self.window.get_window()
-        if not window:
-            self.set_fallback_icon(image)
-            return
-
-        try:
-            surface = Gdk.cairo_surface_create_from_pixbuf(
-                pbuf,
-                self.scale_factor,
-                window)
-            image.set_from_surface(surface)
-        except Exception as e:
-            print(e)
-            self.set_fallback_icon(image)
+        self.icon_service.request(
+            image, (entry.id, original_size, self.scale_factor),
+            icon, original_size)
 
     def get_donation_site(self, id, store=None):
         """ Get a donation link for the given package """
@@ -260,35 +362,46 @@ class AppSystem:
 
     def get_developers(self, id, store=None):
         """ Get the developer names for the given package """
-        app = self.get_store_variant(store, id)
-        if not app:
+        entry = self.get_entry(store, id)
+        if not entry:
             return None
-        return app.get_developer_name("C")
+        return entry.get_developer()
 
     def get_screenshots(self, id, store=None):
         """ Return wrapped Screenshot objects for the package """
-        app = self.get_store_variant(store, id)
-        if not app:
+        entry = self.get_entry(store, id)
+        if not entry:
             return None
-        screens = app.get_screenshots()
+        screens = entry.get_screenshots()
         if not screens:
             return None
         ret = []
-        for screen in screens:
+        for default, images in screens:
             try:
-                img = Screenshot(screen, self.scale_factor)
+                img = Screenshot(default, images, self.scale_factor)
                 ret.append(img)
             except Exception as e:
                 print("Unable to load screen: {}".format(e))
         return ret
 
+    def get_default_screenshot(self, id, store=None):
+        """ Return the Screenshot shown first for the package """
+        screens = self.get_screenshots(id, store)
+        if not screens:
+            return None
+        for screen in screens:
+            if screen.default:
+                return screen
+        return screens[0]
+
+    def get_thumbnail_size(self):
+        """ Return the (width, height) screenshot thumbnails are shown at """
+        return (As.IMAGE_THUMBNAIL_WIDTH * self.scale_factor,
+                As.IMAGE_THUMBNAIL_HEIGHT * self.scale_factor)
+
     def get_launchable_id(self, id, store=None):
         """ Return the desktop file id for the given package """
-        app = self.get_store_variant(store, id)
-        if not app:
+        entry = self.get_entry(store, id)
+        if not entry:
             return None
-        launch = app.get_launchable_by_kind(As.LaunchableKind.DESKTOP_ID)
-        if launch is None:
-            return None
-
-        return launch.get_value()
+        return entry.get_launchable()
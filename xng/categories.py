@@ -11,9 +11,10 @@
 #  (at your option) any later version.
 #
 
-from gi.repository import GObject, Gtk, Pango, Gdk
+from gi.repository import GObject, Gtk, Pango
 from xng.plugins.base import PopulationFilter, ItemStatus, ProviderItem
 from .loadpage import ScLoadingPage
+from .util.prefetch import ScScreenshotPrefetcher
 import threading
 
 
@@ -143,6 +144,7 @@ class ScCategoriesView(Gtk.Box):
 
     item_first = None
     load_page = None
+    prefetcher = None
 
     software_label = None
 
@@ -156,6 +158,7 @@ class ScCategoriesView(Gtk.Box):
 
         self.context = context
         self.item_first = None
+        self.prefetcher = ScScreenshotPrefetcher(context)
 
         self.layout_constraint = Gtk.Box.new(Gtk.Orientation.VERTICAL, 0)
         self.pack_start(self.layout_constraint, True, True, 0)
@@ -324,18 +327,24 @@ class ScCategoriesView(Gtk.Box):
     def build_component(self, component):
         """ Begin building the component in a thread """
 
+        dispatcher = self.context.dispatcher
+
         # Clear out the old items
-        Gdk.threads_enter()
-        for sproglet in self.item_list.get_children():
-            self.item_list.remove(sproglet)
-        Gdk.threads_leave()
+        dispatcher.dispatch(self.clear_items)
 
         for plugin in self.context.plugins:
             plugin.populate_storage(self,
                                     PopulationFilter.CATEGORY,
                                     component)
 
-        GObject.idle_add(self.reset_scroller)
+        # Runs once every item has been added
+        dispatcher.dispatch(self.reset_scroller)
+
+    def clear_items(self):
+        """ Remove all items from the view """
+        self.prefetcher.clear()
+        for sproglet in self.item_list.get_children():
+            self.item_list.remove(sproglet)
 
     def reset_scroller(self):
         """ Called back on idle loop to reset scroll position """
@@ -349,9 +358,12 @@ class ScCategoriesView(Gtk.Box):
         return False
 
     def add_item(self, id, item, popfilter):
-        """ Adding new item.. """
-        Gdk.threads_enter()
+        """ Storage API, queue the item for the main loop """
+        self.context.dispatcher.dispatch(self.show_item, item)
+
+    def show_item(self, item):
+        """ Add the widget for a new item """
         wid = ScItemButton(self.context.appsystem, item)
         self.item_list.add(wid)
         wid.show_all()
-        Gdk.threads_leave()
+        self.prefetcher.track(wid, item)
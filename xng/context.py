@@ -15,6 +15,7 @@ from .appsystem import AppSystem
 from .executor import Executor
 from .op_queue import OperationType
 from .plan_view import ScPlanView
+from .util.dispatcher import ScDispatcher
 from .util.fetcher import ScMediaFetcher
 from .util.desktop import ScDesktopIntegration
 from gi.repository import GObject, GLib
@@ -28,13 +29,12 @@ class ScContext(GObject.Object):
     appsystem = None
     has_loaded = False
     fetcher = None
+    dispatcher = None
     executor = None
     window = None
     desktop = None
     plan_view = None
 
-    sources_count = 0
-
     __gtype_name__ = "ScContext"
 
     __gsignals__ = {
@@ -45,6 +45,7 @@ class ScContext(GObject.Object):
         GObject.Object.__init__(self)
         self.has_loaded = False
         self.window = window
+        self.dispatcher = ScDispatcher()
         self.executor = Executor(self)
         self.executor.connect('refreshed', self.on_refreshed)
         self.desktop = ScDesktopIntegration()
@@ -193,18 +194,16 @@ class ScContext(GObject.Object):
         sources = []
         for plugin in self.plugins:
             sources.extend(plugin.sources())
-        self.sources_count = len(sources)
-        for source in sources:
-            self.executor.refresh_source(source)
+        if not sources:
+            return
+        self.executor.refresh_sources(sources)
 
     def on_refreshed(self, executor):
         """ When all sources have refreshed, we can start the first check
             for available updates, otherwise we risk grabbing stale update
             information.
         """
-        self.sources_count -= 1
-        if self.sources_count == 0:
-            GObject.idle_add(self.enqueue_update_refresh)
+        GObject.idle_add(self.enqueue_update_refresh)
 
     def enqueue_update_refresh(self):
         """ Tell the window to check for updates through the updates view """
@@ -13,8 +13,84 @@
 
 
 from .op_queue import OperationQueue, Operation, OperationType
-from gi.repository import GObject, Gdk, GLib, Notify
+from .plugins.base import OperationStatus, ProgressPhase, ProgressSnapshot
+from gi.repository import GObject, GLib, Notify
 from threading import Lock, Thread
+from collections import OrderedDict
+import Queue
+
+# Publish progress to the UI at most this often
+PROGRESS_INTERVAL_MS = 100
+
+
+class RefreshBatch(GObject.Object):
+    """ RefreshBatch refreshes a set of sources as a single operation.
+        Sources from different plugins are refreshed concurrently, and each
+        plugin decides how many of its own sources may refresh at once.
+    """
+
+    sources = None
+    statuses = None
+    lock = None
+
+    __gtype_name__ = "ScRefreshBatch"
+
+    def __init__(self, sources):
+        GObject.Object.__init__(self)
+        self.sources = list(sources)
+        self.statuses = []
+        self.lock = Lock()
+
+    def describe(self):
+        if len(self.sources) == 1:
+            return _("Refresh source {}").format(self.sources[0].get_name())
+        return _("Refresh sources")
+
+    def run(self, executor):
+        """ Refresh every source, blocking until all have finished, and
+            return the overall OperationStatus """
+        groups = OrderedDict()
+        for source in self.sources:
+            groups.setdefault(source.get_plugin(), []).append(source)
+
+        threads = []
+        for plugin, sources in groups.items():
+            pending = Queue.Queue()
+            for source in sources:
+                pending.put(source)
+            limit = max(1, min(plugin.get_refresh_concurrency(),
+                               len(sources)))
+            for i in xrange(limit):
+                thr = Thread(target=self.refresh_worker,
+                             args=(executor, plugin, pending))
+                thr.daemon = True
+                thr.start()
+                threads.append(thr)
+
+        for thr in threads:
+            thr.join()
+
+        if all(x == OperationStatus.SUCCEEDED for x in self.statuses):
+            return OperationStatus.SUCCEEDED
+        if OperationStatus.FAILED in self.statuses:
+            return OperationStatus.FAILED
+        return OperationStatus.CANCELLED
+
+    def refresh_worker(self, executor, plugin, pending):
+        """ Keep refreshing this plugin's sources until none are left """
+        while True:
+            try:
+                source = pending.get_nowait()
+            except Queue.Empty:
+                return
+            status = OperationStatus.FAILED
+            try:
+                future = plugin.refresh_source(executor, source)
+                status = future.wait()
+            except Exception as e:
+                print("Failed to refresh {}: {}".format(source.get_name(), e))
+            with self.lock:
+                self.statuses.append(status)
 
 
 class Executor(GObject.Object):
@@ -26,8 +102,10 @@ class Executor(GObject.Object):
     thread_lock = None
     thread_running = False
 
-    progress_string = None
-    progress_value = None
+    progress = None  # Latest ProgressSnapshot, replaced not mutated
+    progress_lock = None  # Serialises replacing the snapshot
+    published = None  # Last snapshot we told the UI about
+    publish_id = None
     job_description = None
     notification = None
     context = None
@@ -38,6 +116,7 @@ class Executor(GObject.Object):
         'execution-started': (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE, ()),
         'execution-ended': (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE, ()),
         'refreshed': (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE, ()),
+        'progress-changed': (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE, ()),
         'job-enqueued': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
                          (Operation,)),
         'job-dequeued': (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
@@ -48,38 +127,47 @@ class Executor(GObject.Object):
         GObject.Object.__init__(self)
         self.context = context
 
-        self.progress_value = 0.0
+        self.progress = ProgressSnapshot()
+        self.progress_lock = Lock()
         # Management of the work queue
         self.queue = OperationQueue()
         self.thread_lock = Lock()
         self.thread_running = False
 
-    def set_progress_string(self, msg):
-        """ Update the progress message to be displayed for the ongoing
-            actions
+    def update_progress(self, **fields):
+        """ Merge the given ProgressSnapshot fields into the current
+            progress.
 
-            This should be called by the backend being executed
+            This should be called by the backend being executed, from any
+            thread. It is cheap: nothing reaches the UI until the next
+            publish interval.
         """
-        Gdk.threads_enter()
-        self.progress_string = msg
-        print(msg)
-        Gdk.threads_leave()
-
-    def get_progress_string(self):
-        return self.progress_string
-
-    def get_progress_value(self):
-        return self.progress_value
-
-    def set_progress_value(self, value):
-        """ Set the current progress value that will be displayed
-
-            This should be called by the backend being executed
-        """
-        Gdk.threads_enter()
-        self.progress_value = value
-        print(value)
-        Gdk.threads_leave()
+        with self.progress_lock:
+            self.progress = self.progress.replace(**fields)
+
+    def get_progress(self):
+        return self.progress
+
+    def start_publishing(self):
+        """ Begin publishing progress at a bounded rate """
+        if self.publish_id is None:
+            self.publish_id = GLib.timeout_add(PROGRESS_INTERVAL_MS,
+                                               self.publish_progress)
+
+    def stop_publishing(self):
+        """ Publish any final progress and stop the timer """
+        if self.publish_id is not None:
+            GLib.source_remove(self.publish_id)
+            self.publish_id = None
+        self.publish_progress()
+
+    def publish_progress(self):
+        """ Let the UI know if progress moved since we last looked """
+        progress = self.progress
+        if progress is not self.published:
+            self.published = progress
+            self.emit('progress-changed')
+        return self.publish_id is not None
 
     def get_job_description(self):
         return self.job_description
@@ -112,7 +200,11 @@ class Executor(GObject.Object):
 
     def refresh_source(self, source):
         """ Push a refresh operation onto the queue """
-        self.push_operation(Operation.Refresh(source))
+        self.refresh_sources([source])
+
+    def refresh_sources(self, sources):
+        """ Push a single refresh operation for all of the given sources """
+        self.push_operation(Operation.Refresh(RefreshBatch(sources)))
 
     def maybe_respawn(self):
         """ Start up the worker thread again if our thread ended """
@@ -132,13 +224,16 @@ class Executor(GObject.Object):
         """ Process the queue until it empties """
         while not self.queue.opstack.empty():
             item = self.queue.opstack.get()
+            status = OperationStatus.FAILED
             try:
                 self.emit_dequeued(item)
                 self.set_job_description(item)
                 self.begin_executor_busy(item)
-                self.process_queue_item(item)
+                status = self.process_queue_item(item)
+            except Exception as e:
+                print("Failed to execute {}: {}".format(item.describe(), e))
             finally:
-                self.end_executor_busy(item)
+                self.end_executor_busy(item, status)
 
         # Queue ran out
         print("queue emptied")
@@ -151,37 +246,53 @@ class Executor(GObject.Object):
     def set_job_description(self, item):
         """ Set appropriate job description for sidebar display """
         self.job_description = GLib.markup_escape_text(str(item.describe()))
-        # Update our initial display label
-        self.progress_string = "{}…".format(_("Waiting"))
+        # Start every job from a clean slate
+        with self.progress_lock:
+            self.progress = ProgressSnapshot(phase=ProgressPhase.WAITING)
 
     def process_queue_item(self, item):
-        """ Handle execution of a single item """
+        """ Handle execution of a single item, returning once the plugin
+            has resolved the job's future """
+        if item.opType == OperationType.REFRESH:
+            return item.data.run(self)
+
         plugin = item.data.get_plugin()
+        future = None
         # Process
         if item.opType == OperationType.INSTALL:
-            plugin.install_item(self, item.data)
+            future = plugin.install_item(self, item.data)
         elif item.opType == OperationType.REMOVE:
-            plugin.remove_item(self, item.data)
+            future = plugin.remove_item(self, item.data)
         elif item.opType == OperationType.UPGRADE:
-            plugin.remove_item(self, item.data)
-        elif item.opType == OperationType.REFRESH:
-            plugin.refresh_source(self, item.data)
+            future = plugin.upgrade_item(self, item.data)
+        if future is None:
+            return OperationStatus.FAILED
+        status = future.wait()
+        if status == OperationStatus.FAILED:
+            print("Job failed: {}".format(future.get_error()))
+        return status
 
     def begin_executor_busy(self, item):
         """ Let listeners know the executor is stepping into a job now """
-        Gdk.threads_enter()
+        self.context.dispatcher.dispatch(self.announce_started)
+
+    def announce_started(self):
+        """ Job started, on the main loop """
         self.emit('execution-started')
-        Gdk.threads_leave()
+        self.start_publishing()
 
-    def end_executor_busy(self, item):
+    def end_executor_busy(self, item, status):
         """ Let listeners know we're done for now """
-        Gdk.threads_enter()
+        self.context.dispatcher.dispatch(self.announce_ended, item, status)
+
+    def announce_ended(self, item, status):
+        """ Job ended, on the main loop """
+        self.stop_publishing()
         self.emit('execution-ended')
         if item.opType == OperationType.REFRESH:
             self.emit('refreshed')
         else:
-            self.notify_ended(item)
-        Gdk.threads_leave()
+            self.notify_ended(item, status)
 
     def get_item_name(self, item):
         """ Get the nice name for the item """
@@ -189,12 +300,19 @@ class Executor(GObject.Object):
         app_name = self.context.appsystem.get_name(id, item.get_name())
         return GLib.markup_escape_text(str(app_name))
 
-    def notify_ended(self, item):
+    def notify_ended(self, item, status):
         """ Send a notification to indicate job ending """
         icon_name = "system-software-install"
         body = None
         title = None
-        if item.opType == OperationType.INSTALL:
+        if status == OperationStatus.CANCELLED:
+            title = _("Operation cancelled")
+            body = _("No changes were made")
+        elif status != OperationStatus.SUCCEEDED:
+            icon_name = "dialog-error"
+            title = _("Operation failed")
+            body = _("Not all changes could be applied")
+        elif item.opType == OperationType.INSTALL:
             name = self.get_item_name(item.data.primary_item)
             title = _("New software installed")
             body = _("Installed {}").format(name)
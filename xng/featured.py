@@ -13,6 +13,7 @@
 
 from gi.repository import Gtk, GObject, Gdk
 from .plugins.base import PopulationFilter, ProviderItem
+from .util.prefetch import ScScreenshotPrefetcher
 
 
 class ScFeaturedPage(Gtk.Box):
@@ -117,6 +118,7 @@ class ScFeatured(Gtk.EventBox):
     pages = []
     dots = []
     idx = 0
+    prefetcher = None
 
     __gtype_name__ = "ScFeatured"
 
@@ -128,6 +130,7 @@ class ScFeatured(Gtk.EventBox):
     def __init__(self, context):
         Gtk.EventBox.__init__(self)
         self.context = context
+        self.prefetcher = ScScreenshotPrefetcher(context)
         self.get_style_context().add_class("featured-box")
         self.get_style_context().add_class("content-view")
 
@@ -176,7 +179,10 @@ class ScFeatured(Gtk.EventBox):
 
     def add_item(self, id, item, popfilter):
         """ Implement the population storage API """
+        self.context.dispatcher.dispatch(self.add_page, item)
 
+    def add_page(self, item):
+        """ Add a page and its navigation dot for a new item """
         thumb = ScFeaturedThumb(len(self.pages))
         self.thumbs.pack_start(thumb, False, False, 0)
         thumb.show_all()
@@ -189,6 +195,7 @@ class ScFeatured(Gtk.EventBox):
         if not page.get_realized():
             page.realize()
         page.set_size_request(-1, -1)
+        self.prefetcher.track(page, item)
         self.pages.append(page)
         self.dots.append(thumb)
         self.navigate(0)
@@ -245,7 +252,8 @@ class ScFeaturedEmbed(Gtk.Revealer):
                 self.widget, PopulationFilter.FEATURED,
                 self.context.appsystem)
         self.loaded = True
-        self.slide_down_show()
+        # Reveal once the pages have been added
+        self.context.dispatcher.dispatch(self.slide_down_show)
 
     def slide_up_hide(self):
         """ Slide up out of view """
@@ -11,8 +11,9 @@
 #  (at your option) any later version.
 #
 
-from gi.repository import Gtk, GObject, Pango, Gdk
+from gi.repository import Gtk, GObject, Pango
 from xng.plugins.base import PopulationFilter, ProviderItem, ProviderCategory
+from .util.prefetch import ScScreenshotPrefetcher
 import threading
 
 
@@ -99,6 +100,7 @@ class ScHomeView(Gtk.Box):
     categories = None
     recents = None
     recents_home = None
+    prefetcher = None
 
     __gtype_name__ = "ScHomeView"
 
@@ -117,6 +119,7 @@ class ScHomeView(Gtk.Box):
 
         self.context = context
         self.context.connect('loaded', self.on_context_loaded)
+        self.prefetcher = ScScreenshotPrefetcher(context)
         self.set_margin_top(24)
 
         self.next_items = Gtk.Box.new(Gtk.Orientation.VERTICAL, 0)
@@ -174,10 +177,11 @@ class ScHomeView(Gtk.Box):
         thr.start()
 
     def build_view(self):
+        dispatcher = self.context.dispatcher
         for plugin in self.context.plugins:
             # Build the categories
             for cat in plugin.categories():
-                self.add_category(plugin, cat)
+                dispatcher.dispatch(self.add_category, plugin, cat)
 
             # Build the recently updated view
             plugin.populate_storage(
@@ -185,16 +189,14 @@ class ScHomeView(Gtk.Box):
                 self.context.appsystem)
 
         # Allow the window to become "fully loaded" now
-        GObject.idle_add(self.context.window_done)
+        dispatcher.dispatch(self.context.window_done)
 
     def add_category(self, plugin, category):
         """ Add a main category to our view """
-        Gdk.threads_enter()
         button = ScTileButton(category)
         button.connect("clicked", self.on_category_clicked)
         button.show_all()
         self.categories.add(button)
-        Gdk.threads_leave()
 
     def on_category_clicked(self, btn, udata=None):
         """ One of our main categories has been clicked """
@@ -203,9 +205,7 @@ class ScHomeView(Gtk.Box):
     def add_item(self, id, item, popfilter):
         if popfilter != PopulationFilter.RECENT:
             return
-        Gdk.threads_enter()
-        self.add_recent(item)
-        Gdk.threads_leave()
+        self.context.dispatcher.dispatch(self.add_recent, item)
 
     def maybe_build_row(self, plugin):
         """ Find an appropriate Recent row for the plugin """
@@ -230,3 +230,4 @@ class ScHomeView(Gtk.Box):
         button.connect("clicked", self.on_recent_clicked)
         button.show_all()
         box.add(button)
+        self.prefetcher.track(button, item)
@@ -11,7 +11,7 @@
 #  (at your option) any later version.
 #
 
-from gi.repository import Gtk, Gdk
+from gi.repository import Gtk, Gdk, GdkPixbuf
 from gi.repository import AppStreamGlib as As
 
 
@@ -34,6 +34,9 @@ class ScImageWidget(Gtk.Frame):
     # Are we in thumbnail mode?
     thumbnail = False
 
+    # Have we shown the real image for uri yet?
+    complete = False
+
     def __init__(self, thumbnail=False):
         Gtk.Frame.__init__(self)
         # Be at least the size of a thumbnail
@@ -111,9 +114,34 @@ class ScImageWidget(Gtk.Frame):
             self.page_loading.set_size_request(64, 64)
         self.stack.add_named(self.page_loading, "page-loading")
 
+    def get_image_size(self):
+        """ Return the (width, height) in pixels we display images at """
+        scale = self.get_scale_factor()
+        if self.thumbnail:
+            return (As.IMAGE_THUMBNAIL_WIDTH * scale,
+                    As.IMAGE_THUMBNAIL_HEIGHT * scale)
+        return (As.IMAGE_LARGE_WIDTH * scale, As.IMAGE_LARGE_HEIGHT * scale)
+
+    def show_preview(self, pbuf):
+        """ Show a smaller version of the image, i.e. the thumbnail, scaled
+            up to our size until the real image has loaded """
+        if self.complete:
+            return
+        (width, height) = self.get_image_size()
+        ratio = min(float(width) / pbuf.get_width(),
+                    float(height) / pbuf.get_height())
+        pbuf = pbuf.scale_simple(int(pbuf.get_width() * ratio),
+                                 int(pbuf.get_height() * ratio),
+                                 GdkPixbuf.InterpType.BILINEAR)
+        self.set_pixbuf(pbuf)
+
     def show_image(self, uri, pbuf):
         """ Show the loaded image and switch to it on the view """
         self.uri = uri
+        self.complete = True
+        self.set_pixbuf(pbuf)
+
+    def set_pixbuf(self, pbuf):
         self.page_loading.stop()
         try:
             surface = Gdk.cairo_surface_create_from_pixbuf(
@@ -129,6 +157,7 @@ class ScImageWidget(Gtk.Frame):
     def show_failed(self, uri, err):
         """ Show that the image loading failed """
         self.uri = uri
+        self.complete = True
         self.page_loading.stop()
         # TODO: Do something with the error
         self.stack.set_visible_child_name("page-not-found")
@@ -141,5 +170,6 @@ class ScImageWidget(Gtk.Frame):
 
     def show_loading(self):
         self.uri = None
+        self.complete = False
         self.page_loading.start()
         self.stack.set_visible_child_name("page-loading")
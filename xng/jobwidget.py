@@ -12,6 +12,8 @@
 #
 
 from gi.repository import Gtk, GLib
+from .plugins.base import ProgressPhase
+from .util import sc_format_size_local
 
 
 class ScJobWidget(Gtk.Box):
@@ -29,7 +31,6 @@ class ScJobWidget(Gtk.Box):
     size_group = None
 
     context = None
-    monitor_id = None
 
     def __init__(self, context=None):
         Gtk.Box.__init__(self, orientation=Gtk.Orientation.VERTICAL)
@@ -74,38 +75,54 @@ class ScJobWidget(Gtk.Box):
         # Make sure we know what the context is doing
         self.context.executor.connect('execution-started', self.start_exec)
         self.context.executor.connect('execution-ended', self.end_exec)
+        self.context.executor.connect('progress-changed', self.on_progress)
 
     def start_exec(self, executor):
-        """ Executor started a job, start monitoring now """
-        # Stop existing monitor
-        if self.monitor_id is not None:
-            print("Removing old monitor")
-            GLib.source_remove(self.monitor_id)
-            self.monitor_id = None
-
+        """ Executor started a job, show what it is """
         # Give us an appropriate display label
         self.title_label.set_markup("<small>{}</small>".format(
             self.context.executor.get_job_description()))
-
-        # Set up new monitor
-        print("Adding new monitor")
-        self.monitor_id = GLib.timeout_add(50, self.monitor_callback)
+        self.on_progress(executor)
 
     def end_exec(self, executor):
-        """ Executor ended a job, stop monitoring now """
-        if self.monitor_id is not None:
-            print("Stopped old monitor")
-            GLib.source_remove(self.monitor_id)
-            self.monitor_id = None
+        """ Executor ended a job, nothing to do until the next one """
         pass
 
-    def monitor_callback(self):
-        """ Idle timer to routinely update our state """
-        self.action_label.set_markup("<small>{}</small>".format(
-            self.context.executor.get_progress_string()))
-        self.progressbar.set_fraction(
-            self.context.executor.get_progress_value())
-        return self.monitor_id is not None
+    def on_progress(self, executor):
+        """ Executor published new progress for us to display """
+        progress = executor.get_progress()
+        text = GLib.markup_escape_text(self.format_progress(progress))
+        self.action_label.set_markup("<small>{}</small>".format(text))
+        self.progressbar.set_fraction(progress.fraction)
+
+    def format_progress(self, progress):
+        """ Turn the structured progress into a human readable string """
+        package = progress.package
+        if progress.phase == ProgressPhase.DOWNLOADING:
+            if not progress.speed:
+                return _("Downloading {}").format(package)
+            return _("Downloading {} ({}/s)").format(
+                package, sc_format_size_local(progress.speed))
+        elif progress.phase == ProgressPhase.CONFIGURING:
+            return _("Updating system configuration")
+        elif progress.phase == ProgressPhase.REFRESHING:
+            return _("Updating repository information")
+        elif progress.phase == ProgressPhase.APPSTREAM:
+            return _("Updating AppStream data")
+
+        formats = {
+            ProgressPhase.EXTRACTING: _("Extracting {} ({} / {})"),
+            ProgressPhase.INSTALLING: _("Installing {} ({} / {})"),
+            ProgressPhase.INSTALLED: _("Installed {} ({} / {})"),
+            ProgressPhase.REMOVING: _("Removing {} ({} / {})"),
+            ProgressPhase.REMOVED: _("Removed {} ({} / {})"),
+            ProgressPhase.UPGRADING: _("Upgrading {} ({} / {})"),
+            ProgressPhase.UPGRADED: _("Upgraded {} ({} / {})"),
+        }
+        if progress.phase in formats:
+            return formats[progress.phase].format(
+                package, progress.index, progress.total)
+        return "{}…".format(_("Waiting"))
 
     def update_job(self, job):
         """ Update our appearance based on a pending job """
@@ -11,9 +11,10 @@
 #  (at your option) any later version.
 #
 
-from gi.repository import Gtk, Gdk, GLib
+from gi.repository import Gtk, GLib
 import threading
 from .op_queue import OperationType
+from .plugins.base import PlanError
 
 
 class ScExtraItem(Gtk.ListBoxRow):
@@ -119,6 +120,7 @@ class ScPlanView(Gtk.Box):
     box_removals = None
     box_upgrades = None
 
+    label_download_size = None
     label_space_used = None
     label_space_freed = None
 
@@ -127,6 +129,7 @@ class ScPlanView(Gtk.Box):
     body_pane = None
     scroller = None
     transaction = None
+    plan_serial = 0  # Discard plans for requests we've moved on from
 
     def __init__(self, context):
         Gtk.Box.__init__(self, orientation=Gtk.Orientation.VERTICAL)
@@ -151,6 +154,14 @@ class ScPlanView(Gtk.Box):
 
     def build_footer(self):
         """ Build the primary header which is always visible """
+        # Show how much we need to fetch
+        self.label_download_size = Gtk.Label.new("")
+        self.label_download_size.show_all()
+        self.label_download_size.set_no_show_all(True)
+        self.pack_start(self.label_download_size, False, False, 0)
+        self.label_download_size.set_margin_bottom(6)
+        self.label_download_size.set_halign(Gtk.Align.START)
+
         # Allow showing how much space is going to be used here
         self.label_space_used = Gtk.Label.new("")
         self.label_space_used.show_all()
@@ -216,45 +227,86 @@ class ScPlanView(Gtk.Box):
         """ Prepare to be shown on screen """
         self.item = item
         self.operation_type = operation_type
-        thr = threading.Thread(target=self.begin_operation)
+        self.transaction = None
+        self.plan_serial += 1
+        thr = threading.Thread(target=self.begin_operation,
+                               args=(self.plan_serial, item, operation_type))
 
-        # TODO: Enforce modality so we can't dismiss!
-        self.context.set_window_busy(True)
+        # Remain interactive, but don't allow accepting a stale plan
+        self.button_accept.set_sensitive(False)
 
         # Start the operation calculation
         thr.start()
 
-    def begin_operation(self):
+    def begin_operation(self, serial, item, operation_type):
         """ Here we begin the actual planning for this dialog... """
         # Get this dude in a second
         transaction = None
-        self.transaction = None
-        plugin = self.item.get_plugin()
-
-        if self.operation_type == OperationType.INSTALL:
-            transaction = plugin.plan_install_item(self.item)
-        elif self.operation_type == OperationType.REMOVE:
-            transaction = plugin.plan_remove_item(self.item, automatic=True)
-        elif self.operation_type == OperationType.UPGRADE:
-            transaction = plugin.plan_upgrade_item(self.item)
-        else:
-            print("!!! UNSUPPORTED OPERATION !!!")
+        plugin = item.get_plugin()
+
+        try:
+            if operation_type == OperationType.INSTALL:
+                transaction = plugin.plan_install_item(item)
+            elif operation_type == OperationType.REMOVE:
+                transaction = plugin.plan_remove_item(item, automatic=True)
+            elif operation_type == OperationType.UPGRADE:
+                transaction = plugin.plan_upgrade_item(item)
+            else:
+                print("!!! UNSUPPORTED OPERATION !!!")
+                return
+        except PlanError as e:
+            print("Unable to plan {}: {}".format(item.get_id(), e))
+            self.context.dispatcher.dispatch(self.show_failure, serial, e)
             return
 
         print(transaction.removals)
         print(transaction.installations)
         print(transaction.upgrades)
 
-        # Set ourselves sensitive/usable again
-        Gdk.threads_enter()
-        self.context.set_window_busy(False)
+        # Price the downloads in one go off the main loop
+        download_total = transaction.compute_download_size()
+        self.context.dispatcher.dispatch(self.show_plan, serial, transaction,
+                                         download_total)
+
+    def show_failure(self, serial, error):
+        """ Replace any previous plan with the reason planning failed,
+            leaving nothing to accept """
+        if serial != self.plan_serial:
+            return
+        self.transaction = None
+        self.button_accept.set_sensitive(False)
+        for box in (self.box_installs, self.box_removals, self.box_upgrades):
+            box.populate_from_set([])
+        self.label_space_used.hide()
+        self.label_space_freed.hide()
+        self.label_download_size.set_markup(
+            _("<small>Unable to plan changes: <b>{}</b></small>").format(
+                GLib.markup_escape_text(str(error))))
+        self.label_download_size.show()
+
+    def show_plan(self, serial, transaction, download_total):
+        """ Show the computed plan, on the main loop """
+        if serial != self.plan_serial:
+            # Another plan was requested while we worked
+            return
         self.transaction = transaction
+        self.button_accept.set_sensitive(True)
 
         # Update boxes based on operation set
         self.box_installs.populate_from_set(transaction.installations)
         self.box_removals.populate_from_set(transaction.removals)
         self.box_upgrades.populate_from_set(transaction.upgrades)
 
+        # Show download size?
+        if download_total > 0:
+            download_size = transaction.get_download_size()
+            self.label_download_size.set_markup(
+                _("<small>Download size: <b>{}</b></small>").format(
+                    download_size))
+            self.label_download_size.show()
+        else:
+            self.label_download_size.hide()
+
         # Show install size?
         if transaction.install_size > 0:
             install_size = transaction.get_install_size()
@@ -274,6 +326,3 @@ class ScPlanView(Gtk.Box):
             self.label_space_freed.show()
         else:
             self.label_space_freed.hide()
-
-        # Get back out of ugly gdk lock land
-        Gdk.threads_leave()
@@ -15,6 +15,7 @@ from gi.repository import GObject
 from xng.op_queue import OperationType
 from ..util import sc_format_size_local
 from collections import OrderedDict
+import threading
 
 
 class PopulationFilter:
@@ -61,6 +62,114 @@ class ItemLink:
     ENHANCES = 1 << 1  # Enhances the parent Item in some way.
 
 
+class OperationStatus:
+    """ The OperationStatus tells the Executor how an operation ended """
+
+    PENDING = 0    # Still running
+    SUCCEEDED = 1  # Completed normally
+    FAILED = 2     # Backend reported an error
+    CANCELLED = 3  # User cancelled, or failed to authenticate
+
+
+class ProgressPhase:
+    """ The ProgressPhase says what an executing operation is doing right
+        now, leaving the formatting to the UI
+    """
+
+    WAITING = 0
+    DOWNLOADING = 1
+    EXTRACTING = 2
+    INSTALLING = 3
+    INSTALLED = 4
+    REMOVING = 5
+    REMOVED = 6
+    UPGRADING = 7
+    UPGRADED = 8
+    CONFIGURING = 9   # System configuration triggers
+    REFRESHING = 10   # Updating repository information
+    APPSTREAM = 11    # Updating AppStream data
+
+
+class ProgressSnapshot:
+    """ A ProgressSnapshot is an immutable view of the progress of the
+        current operation. Backends never modify a snapshot, they replace
+        it, so readers on other threads always see a consistent state.
+    """
+
+    phase = ProgressPhase.WAITING
+    package = None      # Package or file currently being worked on
+    index = 0           # 1-based index of the current operation
+    total = 0           # Total number of operations
+    downloaded = 0      # Bytes downloaded of the current file
+    download_size = 0   # Size of the current file
+    speed = 0           # Download speed in bytes per second
+    fraction = 0.0      # Overall completion
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            if not hasattr(ProgressSnapshot, key):
+                raise AttributeError("Unknown progress field: " + key)
+            setattr(self, key, value)
+
+    def replace(self, **fields):
+        """ Return a new snapshot with the given fields changed """
+        merged = dict(self.__dict__)
+        merged.update(fields)
+        return ProgressSnapshot(**merged)
+
+
+class PlanError(Exception):
+    """ Raised by a ProviderPlugin when an operation can't be planned,
+        such as when a dependency can't be satisfied """
+    pass
+
+
+class OperationFuture:
+    """ An OperationFuture is returned by a ProviderPlugin from each of the
+        execution methods, and is resolved by the plugin as soon as the
+        backend reports the outcome. The Executor blocks on it, so it can
+        move on to the next job the moment the current one completes.
+    """
+
+    event = None
+    status = OperationStatus.PENDING
+    error = None
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def resolve(self, status, error=None):
+        """ Resolve the future. Only the first resolution counts. """
+        if self.event.is_set():
+            return
+        self.status = status
+        self.error = error
+        self.event.set()
+
+    def succeed(self):
+        self.resolve(OperationStatus.SUCCEEDED)
+
+    def fail(self, error=None):
+        self.resolve(OperationStatus.FAILED, error)
+
+    def cancel(self, error=None):
+        self.resolve(OperationStatus.CANCELLED, error)
+
+    def is_done(self):
+        return self.event.is_set()
+
+    def wait(self, timeout=None):
+        """ Block until resolved, returning the final status """
+        self.event.wait(timeout)
+        return self.status
+
+    def get_status(self):
+        return self.status
+
+    def get_error(self):
+        return self.error
+
+
 class Transaction(GObject.Object):
     """ The Transaction class wraps a planned operation and returns the
         set of operations to be performed. This allows internal code to
@@ -71,6 +180,7 @@ class Transaction(GObject.Object):
     __gtype_name__ = "NxTransaction"
 
     primary_item = None  # Associated primary item
+    plugin = None  # Plugin that will execute this transaction
 
     removals = None  # Any removals we need to perform (conflicts)
 
@@ -84,6 +194,7 @@ class Transaction(GObject.Object):
 
     download_total = 0    # Total amount to download
     download_current = 0  # Total amount downloaded
+    download_pending = None  # Items still to be priced for download
 
     install_size = 0  # Total installation size
     remove_size = 0   # Total removal size
@@ -92,11 +203,12 @@ class Transaction(GObject.Object):
 
     items = None
 
-    def __init__(self, primary_item=None):
+    def __init__(self, primary_item=None, plugin=None):
         GObject.Object.__init__(self)
 
         self.primary_item = primary_item
         self.op_counter = 0
+        self.plugin = plugin
         if primary_item:
             self.plugin = primary_item.get_plugin()
 
@@ -104,6 +216,7 @@ class Transaction(GObject.Object):
         self.installations = set()
         self.upgrades = set()
         self.items = dict()
+        self.download_pending = set()
 
     def set_autoremove(self, a):
         self.autoremove = a
@@ -158,8 +271,22 @@ class Transaction(GObject.Object):
         self.upgrades.remove(item)
 
     def increment_download_size(self, item):
-        """ Add the total download size we're going to need """
-        self.download_total += item.get_download_size()
+        """ Queue the item to be priced by compute_download_size """
+        self.download_pending.add(item)
+
+    def compute_download_size(self):
+        """ Price every queued download, in one batch per plugin, and
+            return the total amount we're going to need to download """
+        if not self.download_pending:
+            return self.download_total
+        plugins = dict()
+        for item in self.download_pending:
+            plugins.setdefault(item.get_plugin(), []).append(item)
+        for plugin, items in plugins.items():
+            sizes = plugin.get_download_sizes(items)
+            self.download_total += sum(sizes.values())
+        self.download_pending = set()
+        return self.download_total
 
     def increment_install_size(self, item):
         """ Add to the total install size """
@@ -185,9 +312,10 @@ class Transaction(GObject.Object):
 
     def get_download_fraction(self):
         """ Return the total amount to be downloaded """
+        download_total = max(self.compute_download_size(), 1)
         if self.download_current == 0:
-            return 1.0 / float(self.download_total)
-        return float(self.download_current) / float(self.download_total)
+            return 1.0 / float(download_total)
+        return float(self.download_current) / float(download_total)
 
     def count_installations(self):
         """ Total number of install operations """
@@ -208,7 +336,10 @@ class Transaction(GObject.Object):
         elif self.op_type == OperationType.REMOVE:
             sb = "Remove: {}".format(self.primary_item.get_id())
         elif self.op_type == OperationType.UPGRADE:
-            sb = "Upgrade: {}".format(self.primary_item.get_id())
+            if self.primary_item:
+                sb = "Upgrade: {}".format(self.primary_item.get_id())
+            else:
+                sb = "Upgrade: {} packages".format(len(self.items))
 
         # Format for debug
         sb2 = sb
@@ -220,6 +351,10 @@ class Transaction(GObject.Object):
 
         return sb
 
+    def get_download_size(self):
+        """ Return string form of the total download size """
+        return sc_format_size_local(self.compute_download_size())
+
     def get_install_size(self):
         """ Return string form of the total installation size """
         return sc_format_size_local(self.install_size)
@@ -301,6 +436,10 @@ class ProviderStorage(GObject.Object):
 
         Storage may be recycled at any time and is used simply to allow
         dynamic "pushing" of items into the storage
+
+        Plugins may add items from any thread, so storage backed by widgets
+        should hand them over to the main loop through the context's
+        ScDispatcher rather than touching the UI directly.
     """
 
     __gtype_name__ = "NxProviderStorage"
@@ -324,6 +463,7 @@ class SearchRequest(GObject.Object):
 
     installed_only = False
     term = None
+    appsystem = None
 
     def __init__(self, term):
         GObject.Object.__init__(self)
@@ -339,6 +479,13 @@ class SearchRequest(GObject.Object):
     def get_term(self):
         return self.term
 
+    def set_appsystem(self, appsystem):
+        """ Allow plugins to match against AppStream metadata too """
+        self.appsystem = appsystem
+
+    def get_appsystem(self):
+        return self.appsystem
+
 
 class ProviderPlugin(GObject.Object):
     """ A ProviderPlugin provides its own managemenet and access to the
@@ -371,12 +518,21 @@ class ProviderPlugin(GObject.Object):
         return []
 
     def install_item(self, executor, transaction):
+        """ Implementation must begin installing the transaction and return
+            an OperationFuture, resolved once the backend has finished
+        """
         raise RuntimeError("implement install_item")
 
     def remove_item(self, executor, transaction):
+        """ Implementation must begin removing the transaction and return
+            an OperationFuture, resolved once the backend has finished
+        """
         raise RuntimeError("implement remove_item")
 
     def upgrade_item(self, executor, transaction):
+        """ Implementation must begin upgrading the transaction and return
+            an OperationFuture, resolved once the backend has finished
+        """
         raise RuntimeError("implement upgrade_item")
 
     def plan_upgrade_item(self, items):
@@ -401,10 +557,25 @@ class ProviderPlugin(GObject.Object):
         """
         raise RuntimeError("implement plan_remove_item")
 
+    def get_download_sizes(self, items):
+        """ Return a dict mapping each item ID to the number of bytes that
+            must be downloaded for it. Implementations should override this
+            to price the whole set in one pass.
+        """
+        return dict((x.get_id(), x.get_download_size()) for x in items)
+
     def refresh_source(self, executor, source):
-        """ Implementation needs to refresh the given source """
+        """ Implementation needs to refresh the given source, returning an
+            OperationFuture resolved once the refresh has finished
+        """
         raise RuntimeError("implement refresh_source")
 
+    def get_refresh_concurrency(self):
+        """ How many of this plugin's sources may be refreshed at the same
+            time. refresh_source must be thread safe if this is above 1.
+        """
+        return 1
+
 
 class ProviderItem(GObject.Object):
     """ A ProviderItem is addded to the ProviderStorage by each ProviderPlugin
@@ -0,0 +1,323 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2017-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+
+import hashlib
+import mmap
+import os
+import struct
+
+import pisi.context
+
+# Bump whenever the on-disk layout changes so old catalogs get rebuilt
+CATALOG_MAGIC = "SCEC"
+CATALOG_VERSION = 3
+
+# magic, version, record count, string table offset, repo index stamp
+HEADER = struct.Struct("<4sIII32s")
+
+# (offset, length) pairs into the string table for the name, version,
+# partOf, summary, history date, history type, dependencies and conflicts,
+# followed by the release, the parsed history date, packageSize and
+# installedSize
+RECORD = struct.Struct("<16IIIQQ")
+
+# Just the name reference of a record, used while searching
+RECORD_NAME = struct.Struct("<II")
+
+# Just the parsed history date of a record, used for recency ordering
+RECORD_DATE = struct.Struct("<I")
+RECORD_DATE_OFFSET = struct.calcsize("<16II")
+
+# Just the dependency and conflict references of a record, used for planning
+RECORD_RELATIONS = struct.Struct("<IIII")
+RECORD_RELATIONS_OFFSET = struct.calcsize("<12I")
+
+
+def get_catalog_path():
+    """ Return the per-user location of the compiled catalog """
+    home = os.path.expanduser("~")
+    return os.path.join(home, ".cache", "solus-sc", "eopkg-catalog")
+
+
+def repo_index_stamp():
+    """ Compute a stamp for the current set of repository indexes so that
+        we only recompile the catalog when eopkg has fetched a new index.
+    """
+    digest = hashlib.sha256()
+    index_dir = pisi.context.config.index_dir()
+    for root, dirs, files in os.walk(index_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            digest.update("{}:{}:{}\n".format(path, st.st_mtime, st.st_size))
+    return digest.digest()
+
+
+def parse_date_key(tstamp):
+    """ Turn a history date into a sortable YYYYMMDD integer, accepting the
+        old %m-%d-%Y form found in some older pspecs. Returns 0 if the date
+        cannot be parsed. """
+    try:
+        parts = [int(x) for x in tstamp.strip().split("-")]
+        if len(parts) != 3:
+            return 0
+        if parts[0] > 31:
+            (year, month, day) = parts
+        else:
+            (month, day, year) = parts
+        if not (1 <= month <= 12 and 1 <= day <= 31):
+            return 0
+        return year * 10000 + month * 100 + day
+    except Exception:
+        return 0
+
+
+def encode_dependency(dep):
+    """ Flatten a pisi Dependency to name, name>=release, name<=release or
+        name=release. Only release constraints are kept as that is all our
+        packaging emits. """
+    name = encode_field(dep.package)
+    if dep.releaseFrom:
+        return "{}>={}".format(name, dep.releaseFrom)
+    if dep.releaseTo:
+        return "{}<={}".format(name, dep.releaseTo)
+    if dep.release:
+        return "{}={}".format(name, dep.release)
+    return name
+
+
+def encode_field(value):
+    """ Flatten pisi's text types down to UTF-8 byte strings """
+    if value is None:
+        return ""
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return str(value)
+
+
+class EopkgHistoryHead:
+    """ The most recent history entry for a catalog record, mirroring the
+        fields of pisi's own Update object that the Software Center uses
+    """
+
+    version = None
+    release = None
+    date = None
+    type = None
+
+    def __init__(self, version, release, date, type):
+        self.version = version
+        self.release = release
+        self.date = date
+        self.type = type
+
+
+class EopkgRecord(object):
+    """ EopkgRecord is a lightweight stand-in for a pisi Package, backed by
+        the memory-mapped catalog. Only the fields required to list packages
+        are available, anything else must come from the PackageDB.
+    """
+
+    __slots__ = [
+        "name",
+        "partOf",
+        "packageSize",
+        "installedSize",
+        "history",
+        "catalog",
+        "summary_ref",
+    ]
+
+    def __init__(self, catalog, fields):
+        self.catalog = catalog
+        self.name = catalog.get_string(fields[0], fields[1])
+        self.partOf = catalog.get_string(fields[4], fields[5])
+        self.summary_ref = (fields[6], fields[7])
+        self.packageSize = fields[18]
+        self.installedSize = fields[19]
+        self.history = [
+            EopkgHistoryHead(
+                catalog.get_string(fields[2], fields[3]),
+                str(fields[16]),
+                catalog.get_string(fields[8], fields[9]),
+                catalog.get_string(fields[10], fields[11])),
+        ]
+
+    @property
+    def summary(self):
+        """ Summaries are only pulled out of the map when asked for """
+        return self.catalog.get_string(*self.summary_ref)
+
+    @property
+    def version(self):
+        return self.history[0].version
+
+    @property
+    def release(self):
+        return self.history[0].release
+
+
+class EopkgCatalog:
+    """ EopkgCatalog is a compact, memory-mapped index of every available
+        package, compiled once per repository index change.
+
+        Records are fixed size and sorted by name, followed by a single
+        string table, so looking up a package is a binary search over the
+        mapping without ever constructing pisi objects.
+    """
+
+    data = None
+    count = 0
+    strings_offset = 0
+    stamp = None
+
+    def __init__(self, data):
+        self.data = data
+        (magic, version, self.count, self.strings_offset, self.stamp) = \
+            HEADER.unpack_from(data, 0)
+        if magic != CATALOG_MAGIC or version != CATALOG_VERSION:
+            raise ValueError("Incompatible catalog")
+
+    @staticmethod
+    def open(path):
+        """ Memory-map an existing catalog from disk """
+        with open(path, "rb") as catalog_file:
+            data = mmap.mmap(catalog_file.fileno(), 0,
+                             access=mmap.ACCESS_READ)
+        return EopkgCatalog(data)
+
+    @staticmethod
+    def compile(stamp, packages):
+        """ Compile the given pisi packages into the catalog format """
+        packages = sorted(packages, key=lambda x: encode_field(x.name))
+        strings = []
+        strings_len = [0]
+        records = []
+
+        def push_string(value):
+            value = encode_field(value)
+            offset = strings_len[0]
+            strings.append(value)
+            strings_len[0] += len(value)
+            return (offset, len(value))
+
+        for pkg in packages:
+            head = pkg.history[0]
+            deps = " ".join(encode_dependency(x)
+                            for x in pkg.runtimeDependencies())
+            conflicts = " ".join(encode_field(x.package)
+                                 for x in pkg.conflicts)
+            refs = push_string(pkg.name) + \
+                push_string(head.version) + \
+                push_string(pkg.partOf) + \
+                push_string(pkg.summary) + \
+                push_string(head.date) + \
+                push_string(head.type) + \
+                push_string(deps) + \
+                push_string(conflicts)
+            records.append(RECORD.pack(*(refs + (
+                int(head.release),
+                parse_date_key(encode_field(head.date)),
+                long(pkg.packageSize or 0),
+                long(pkg.installedSize or 0)))))
+
+        strings_offset = HEADER.size + RECORD.size * len(records)
+        header = HEADER.pack(CATALOG_MAGIC, CATALOG_VERSION, len(records),
+                             strings_offset, stamp)
+        return "".join([header] + records + strings)
+
+    @staticmethod
+    def build(path, stamp, packages):
+        """ Compile a new catalog and atomically replace the one on disk.
+            Failure to write is not fatal, we'll just use it from memory.
+        """
+        data = EopkgCatalog.compile(stamp, packages)
+        tmp_path = path + ".tmp"
+        try:
+            cache_dir = os.path.dirname(path)
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir, 00755)
+            with open(tmp_path, "wb") as catalog_file:
+                catalog_file.write(data)
+            os.rename(tmp_path, path)
+        except Exception as e:
+            print("Unable to store eopkg catalog {}: {}".format(path, e))
+            return EopkgCatalog(data)
+        return EopkgCatalog.open(path)
+
+    def get_stamp(self):
+        return self.stamp
+
+    def get_string(self, offset, length):
+        start = self.strings_offset + offset
+        return self.data[start:start + length]
+
+    def get_name(self, index):
+        """ Decode just the name of the record at the given index """
+        (offset, length) = RECORD_NAME.unpack_from(
+            self.data, HEADER.size + RECORD.size * index)
+        return self.get_string(offset, length)
+
+    def get_date_key(self, index):
+        """ Return the parsed history date of the record at index """
+        return RECORD_DATE.unpack_from(
+            self.data,
+            HEADER.size + RECORD.size * index + RECORD_DATE_OFFSET)[0]
+
+    def get_relations(self, index):
+        """ Return the encoded (dependencies, conflicts) of the record at
+            index, each as a space separated string """
+        (deps_off, deps_len, conf_off, conf_len) = \
+            RECORD_RELATIONS.unpack_from(
+                self.data,
+                HEADER.size + RECORD.size * index + RECORD_RELATIONS_OFFSET)
+        return (self.get_string(deps_off, deps_len),
+                self.get_string(conf_off, conf_len))
+
+    def find(self, name):
+        """ Binary search for the record index of name, or -1 """
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.get_name(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self.get_name(lo) == name:
+            return lo
+        return -1
+
+    def get_record(self, index):
+        """ Decode the complete record at the given index """
+        fields = RECORD.unpack_from(self.data,
+                                    HEADER.size + RECORD.size * index)
+        return EopkgRecord(self, fields)
+
+    def has_package(self, name):
+        return self.find(name) >= 0
+
+    def get_package(self, name):
+        """ Return the EopkgRecord for name, or None if not available """
+        index = self.find(name)
+        if index < 0:
+            return None
+        return self.get_record(index)
+
+    def list_packages(self):
+        """ Return all package names known to the catalog, sorted """
+        return [self.get_name(i) for i in xrange(self.count)]
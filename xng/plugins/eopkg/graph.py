@@ -0,0 +1,214 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2017-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+
+from collections import deque
+import re
+
+import pisi.context
+
+from ..base import PlanError
+
+DEPENDENCY = re.compile(r"^(.+?)(?:(>=|<=|=)(\d+))?$")
+
+
+def parse_dependency(dep):
+    """ Split an encoded catalog dependency into (name, op, release) """
+    match = DEPENDENCY.match(dep)
+    (name, op, release) = match.groups()
+    if release is not None:
+        release = int(release)
+    return (name, op, release)
+
+
+class UnavailableDependency(PlanError):
+    """ A dependency is neither installed nor available from any repo """
+
+    def __init__(self, name, dependent):
+        PlanError.__init__(
+            self, "Unavailable dependency {} required by {}".format(
+                name, dependent))
+        self.name = name
+        self.dependent = dependent
+
+
+class EopkgGraph:
+    """ EopkgGraph is a dependency and conflict graph over the catalog for a
+        single DB generation, used to plan installs and removals without
+        asking pisi to rebuild its own graphs for every request.
+
+        Forward edges are decoded lazily from the catalog, reverse edges
+        come from the InstallDB, and both are kept for the lifetime of the
+        graph. The graph must be dropped whenever the installed set changes.
+    """
+
+    catalog = None
+    installDB = None
+    compDB = None
+
+    deps = None
+    conflicts = None
+    rev_deps = None
+    rev_conflicts = None
+
+    def __init__(self, catalog, installDB, compDB):
+        self.catalog = catalog
+        self.installDB = installDB
+        self.compDB = compDB
+        self.deps = dict()
+        self.conflicts = dict()
+        self.rev_deps = dict()
+
+    def decode(self, name):
+        """ Cache the forward edges for name from the catalog """
+        index = self.catalog.find(name)
+        if index < 0:
+            self.deps[name] = []
+            self.conflicts[name] = []
+            return
+        (deps, conflicts) = self.catalog.get_relations(index)
+        self.deps[name] = [parse_dependency(x) for x in deps.split()]
+        self.conflicts[name] = conflicts.split()
+
+    def get_dependencies(self, name):
+        """ Return the (name, op, release) runtime dependencies of name """
+        if name not in self.deps:
+            self.decode(name)
+        return self.deps[name]
+
+    def get_conflicts(self, name):
+        """ Return the names of all packages name conflicts with """
+        if name not in self.conflicts:
+            self.decode(name)
+        return self.conflicts[name]
+
+    def get_reverse_dependencies(self, name):
+        """ Return the installed packages that depend on name """
+        if name not in self.rev_deps:
+            revs = self.installDB.get_rev_deps(name)
+            self.rev_deps[name] = [x[0] for x in revs]
+        return self.rev_deps[name]
+
+    def get_reverse_conflicts(self, name):
+        """ Return the installed packages that declare a conflict on name """
+        if self.rev_conflicts is None:
+            rev_conflicts = dict()
+            for index in xrange(self.catalog.count):
+                conflicts = self.catalog.get_relations(index)[1]
+                if not conflicts:
+                    continue
+                owner = self.catalog.get_name(index)
+                if not self.installDB.has_package(owner):
+                    continue
+                for conflict in conflicts.split():
+                    rev_conflicts.setdefault(conflict, []).append(owner)
+            self.rev_conflicts = rev_conflicts
+        return self.rev_conflicts.get(name, [])
+
+    def get_available_release(self, name):
+        """ Return the repository release of name, or -1 """
+        index = self.catalog.find(name)
+        if index < 0:
+            return -1
+        return int(self.catalog.get_record(index).release)
+
+    def get_installed_release(self, name):
+        """ Return the installed release of name, or -1 """
+        if not self.installDB.has_package(name):
+            return -1
+        return int(self.installDB.get_version(name)[1])
+
+    def is_satisfied(self, name, op, release):
+        """ Determine if the installed system already satisfies a dep """
+        installed = self.get_installed_release(name)
+        if installed < 0:
+            return False
+        if op == ">=":
+            return installed >= release
+        if op == "<=":
+            return installed <= release
+        if op == "=":
+            return installed == release
+        return True
+
+    def plan_base(self):
+        """ Return the system.base packages that are missing or upgradable,
+            as eopkg insists on these being handled alongside installs """
+        if pisi.context.config.values.general.ignore_safety:
+            return []
+        if not self.compDB.has_component("system.base"):
+            return []
+        ret = []
+        for name in self.compDB.get_packages("system.base", None, True):
+            installed = self.get_installed_release(name)
+            if installed < 0 or installed < self.get_available_release(name):
+                ret.append(name)
+        return ret
+
+    def plan_install(self, names):
+        """ Return every package that must be installed or upgraded to
+            satisfy names, with dependencies ordered before dependents.
+            Raises UnavailableDependency if one can't be satisfied at all """
+        order = []
+        visited = set()
+
+        for root in names:
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(self.get_dependencies(root)))]
+            while stack:
+                (name, deps) = stack[-1]
+                for (dep, op, release) in deps:
+                    if dep in visited or self.is_satisfied(dep, op, release):
+                        continue
+                    if self.catalog.find(dep) < 0:
+                        raise UnavailableDependency(dep, name)
+                    visited.add(dep)
+                    stack.append((dep, iter(self.get_dependencies(dep))))
+                    break
+                else:
+                    stack.pop()
+                    order.append(name)
+        return order
+
+    def plan_conflicts(self, names):
+        """ Return the installed packages that conflict with names """
+        incoming = set(names)
+        ret = set()
+        for name in names:
+            for conflict in self.get_conflicts(name):
+                if conflict in incoming:
+                    continue
+                if self.installDB.has_package(conflict):
+                    ret.add(conflict)
+            for owner in self.get_reverse_conflicts(name):
+                if owner not in incoming:
+                    ret.add(owner)
+        return sorted(ret)
+
+    def plan_remove(self, names):
+        """ Return names along with every installed package that would be
+            left broken by their removal """
+        order = []
+        visited = set()
+        queue = deque(x for x in names if self.installDB.has_package(x))
+        visited.update(queue)
+        while queue:
+            name = queue.popleft()
+            order.append(name)
+            for rev in self.get_reverse_dependencies(name):
+                if rev in visited:
+                    continue
+                visited.add(rev)
+                queue.append(rev)
+        return order
@@ -12,7 +12,6 @@
 #
 
 from ..base import ProviderItem, ItemStatus
-from pisi.operations.helper import calculate_download_sizes
 
 
 class EopkgItem(ProviderItem):
@@ -23,11 +22,22 @@ class EopkgItem(ProviderItem):
         Notably it attempts to track the difference between the installed
         package, if any, and the available repository package (again, if it
         exists).
+
+        The available package is usually an EopkgRecord from the catalog,
+        so anything beyond the basic listing fields is resolved lazily from
+        the PackageDB via get_package.
     """
 
     installed = None
     available = None
     displayCandidate = None
+    package = None
+
+    # Statuses and links are computed on first use, as most items are
+    # only ever listed and never inspected.
+    status_dirty = True
+    links_built = False
+    item_links = None
 
     __gtype_name__ = "NxEopkgItem"
 
@@ -36,20 +46,51 @@ class EopkgItem(ProviderItem):
         self.installed = installed
         self.available = available
 
+        if self.installed is not None:
+            self.displayCandidate = self.installed
+        else:
+            self.displayCandidate = self.available
+
+    def set_installed(self, installed):
+        """ Swap in the new installed package following a transaction. The
+            status is recomputed the next time it is queried. """
+        self.installed = installed
+        self.package = None
+        if self.installed is not None:
+            self.displayCandidate = self.installed
+        elif self.available is not None:
+            self.displayCandidate = self.available
+        self.status_dirty = True
+
+    @property
+    def links(self):
+        """ Build our links the first time anyone looks at them """
+        if not self.links_built:
+            self.links_built = True
+            if self.available and self.parent_plugin:
+                self.parent_plugin.refine_item(self)
+        return self.item_links
+
+    @links.setter
+    def links(self, links):
+        self.item_links = links
+
+    def refresh_status(self):
+        """ Compute the complete status from the installed/available pair """
+        self.status_dirty = False
+        self.status = 0
+
         # NOT YET SUPPORTED
         self.add_status(ItemStatus.META_CHANGELOG)
 
         if self.installed is not None:
-            self.displayCandidate = self.installed
             self.add_status(ItemStatus.INSTALLED)
-            relOld = self.installed.history[0].release
+            relOld = int(self.installed.history[0].release)
             relNew = relOld
             if self.available:
-                relNew = self.available.history[0].release
+                relNew = int(self.available.history[0].release)
             if relNew > relOld:
                 self.add_status(ItemStatus.UPDATE_NEEDED)
-        else:
-            self.displayCandidate = self.available
 
         # Is this an essential item?
         if self.available and is_essential_package(self.available):
@@ -59,6 +100,39 @@ class EopkgItem(ProviderItem):
         if name.endswith("-dbginfo") or name.endswith("-devel"):
             self.add_status(ItemStatus.META_DEVEL)
 
+    def maybe_refresh_status(self):
+        if self.status_dirty:
+            self.refresh_status()
+
+    def get_status(self):
+        self.maybe_refresh_status()
+        return ProviderItem.get_status(self)
+
+    def remove_status(self, st):
+        self.maybe_refresh_status()
+        ProviderItem.remove_status(self, st)
+
+    def add_status(self, st):
+        self.maybe_refresh_status()
+        ProviderItem.add_status(self, st)
+
+    def set_status(self, st):
+        self.status_dirty = False
+        ProviderItem.set_status(self, st)
+
+    def has_status(self, st):
+        self.maybe_refresh_status()
+        return ProviderItem.has_status(self, st)
+
+    def get_package(self):
+        """ Return a complete pisi Package for the display candidate """
+        if self.installed is not None:
+            return self.installed
+        if self.package is None:
+            availDB = self.parent_plugin.availDB
+            self.package = availDB.get_package(self.get_id())
+        return self.package
+
     def get_id(self):
         return str(self.displayCandidate.name)
 
@@ -72,13 +146,14 @@ class EopkgItem(ProviderItem):
         return str(self.displayCandidate.name)
 
     def get_description(self):
-        return str(self.displayCandidate.description)
+        return str(self.get_package().description)
 
     def get_version(self):
         return self.displayCandidate.history[0].version
 
     def get_download_size(self):
-        return calculate_download_sizes((self.displayCandidate.name, ))[0]
+        sizes = self.parent_plugin.get_download_sizes((self, ))
+        return sizes[self.get_id()]
 
     def get_install_size(self):
         return long(self.displayCandidate.installedSize)
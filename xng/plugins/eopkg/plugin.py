@@ -13,24 +13,28 @@
 
 from ..base import ProviderPlugin
 from ..base import PopulationFilter, Transaction, ItemLink
+from ..base import OperationFuture, OperationStatus, ProgressPhase
+from ..base import PlanError
 
 # Plugin local
+from .catalog import EopkgCatalog, get_catalog_path, repo_index_stamp
+from .search_index import EopkgSearchIndex, get_search_index_path
 from .component import EopkgComponent
+from .graph import EopkgGraph
 from .group import EopkgGroup
 from .item import EopkgItem
 from .source import EopkgSource
 
-from gi.repository import AppStreamGlib as As
 import pisi
-from pisi.operations.install import plan_install_pkg_names
-from pisi.operations.remove import plan_remove, plan_autoremove
-from pisi.operations.upgrade import upgrade_base
+import pisi.blacklist
+import pisi.context
+from pisi.operations.remove import plan_autoremove
 # from pisi.operations.upgrade import plan_upgrade
 from pisi.operations import helper as pisi_helper
-import time
 import comar
-import difflib
+import heapq
 import os.path
+import threading
 
 
 class EopkgPlugin(ProviderPlugin):
@@ -49,6 +53,21 @@ class EopkgPlugin(ProviderPlugin):
     compDB = None
     cats = None
 
+    # Compiled view over availDB for listing purposes
+    catalog = None
+    search_index = None
+    recent_apps = None
+
+    # Interned EopkgItems for the current DB generation
+    items = None
+    item_lock = None
+    generation = 0
+
+    # Dependency graph and memoised plans for the current installed set
+    graph = None
+    plans = None
+    plan_lock = None
+
     repos = None
 
     # pisi crap
@@ -58,13 +77,17 @@ class EopkgPlugin(ProviderPlugin):
     # Allow us to track expected operations for progress purposes
     trans = None
     current_package = None
+    current_fetch = None
+    current_fetch_name = None
 
-    operation_blocked = False  # Allow spin locking
+    future = None  # Resolved when COMAR tells us the job is done
 
     __gtype_name__ = "NxEopkgPlugin"
 
     def __init__(self):
         ProviderPlugin.__init__(self)
+        self.item_lock = threading.Lock()
+        self.plan_lock = threading.Lock()
         self.rebuild_db()
 
         # Talk to eopkg/pisi over dbus
@@ -91,8 +114,68 @@ class EopkgPlugin(ProviderPlugin):
         self.repoDB = pisi.db.repodb.RepoDB()
         self.groupDB = pisi.db.groupdb.GroupDB()
         self.compDB = pisi.db.componentdb.ComponentDB()
+        self.rebuild_catalog()
+        self.merge_installed_search()
+        self.recent_apps = None
+
+        # Anything we handed out before now is stale
+        with self.item_lock:
+            self.generation += 1
+            self.items = dict()
+        self.reset_plans()
         print("Rebuilt DBs")
 
+    def rebuild_catalog(self):
+        """ Map the compiled package catalog and search index, recompiling
+            them from availDB only when the repository indexes have actually
+            changed """
+        stamp = repo_index_stamp()
+        if self.catalog and self.catalog.get_stamp() == stamp:
+            return
+
+        path = get_catalog_path()
+        catalog = None
+        try:
+            catalog = EopkgCatalog.open(path)
+            if catalog.get_stamp() != stamp:
+                catalog = None
+        except Exception as e:
+            print("Eopkg catalog needs rebuilding: {}".format(e))
+
+        index_path = get_search_index_path()
+        search_index = None
+        try:
+            search_index = EopkgSearchIndex.open(index_path)
+            if search_index.get_stamp() != stamp:
+                search_index = None
+        except Exception as e:
+            print("Eopkg search index needs rebuilding: {}".format(e))
+
+        if catalog and search_index:
+            self.catalog = catalog
+            self.search_index = search_index
+            return
+
+        print("Compiling eopkg catalog")
+        pkgs = [self.availDB.get_package(x)
+                for x in self.availDB.list_packages(None)]
+        if not catalog:
+            catalog = EopkgCatalog.build(path, stamp, pkgs)
+        if not search_index:
+            search_index = EopkgSearchIndex.build(index_path, stamp, pkgs)
+        self.catalog = catalog
+        self.search_index = search_index
+        print("Compiled eopkg catalog")
+
+    def merge_installed_search(self):
+        """ Local installs and packages dropped from the repos aren't in
+            the compiled search index, so add them to keep them searchable.
+            Called whenever the installed set changes. """
+        self.search_index.merge_packages(
+            self.installDB.get_package(x)
+            for x in self.installDB.list_installed()
+            if self.catalog.find(x) < 0)
+
     def build_categories(self):
         """ Find all of our possible categories and nest them. """
         self.cats = []
@@ -147,13 +230,14 @@ class EopkgPlugin(ProviderPlugin):
 
         limit = 20  # Arbitrary right now
 
-        inp = filter_packages_by_data(self.availDB, appsystem.store)
-        inp.sort(history_sort, reverse=True)
-        if len(inp) > limit:
-            inp = inp[0:limit]
+        recent = self.recent_apps
+        if recent is None:
+            recent = find_recent_apps(self.catalog,
+                                      appsystem.get_entries())
+            self.recent_apps = recent
 
-        for pkg in inp:
-            item = self.build_item(pkg.name)
+        for date, name in heapq.nlargest(limit, recent):
+            item = self.build_item(name)
             storage.add_item(item.get_id(), item, PopulationFilter.RECENT)
 
     def populate_new(self, storage, appsystem):
@@ -192,29 +276,15 @@ class EopkgPlugin(ProviderPlugin):
             storage.add_item(item.get_id(), item, PopulationFilter.NEW)
 
     def populate_search(self, storage, request):
-        """ Attempt to search for a given term in the DB """
-        # Trick eopkg into searching through spaces and hyphens
-        term = request.get_term().replace(" ", "[-_ ]").replace(".", "\.")
-        term = term.replace("+", "\+").replace("?", "\?")
-
-        srslt = set()
-        try:
-            if not request.get_installed_only():
-                srslt.update(self.availDB.search_package([term]))
-            srslt.update(self.installDB.search_package([term]))
-        except Exception as e:
-            # Invalid regex, basically, from someone smashing FIREFOX????
-            print(e)
-            return
-
-        leaders = difflib.get_close_matches(term.lower(),
-                                            srslt, cutoff=0.5)
-        packages = leaders
-        packages.extend(sorted([x for x in srslt if x not in leaders]))
+        """ Look the term up in our search index """
+        term = request.get_term().lower()
+        appsystem = request.get_appsystem()
+        if appsystem:
+            self.search_index.merge_appstream(appsystem.get_entries())
 
         count = 0
 
-        for item in packages:
+        for item in self.search_index.query(term):
             if count >= 100:
                 break
 
@@ -223,6 +293,13 @@ class EopkgPlugin(ProviderPlugin):
                 if "dbginfo" not in term and "devel" not in term:
                     continue
 
+            installed = self.installDB.has_package(item)
+            if request.get_installed_only() and not installed:
+                continue
+            if not installed and self.catalog.find(item) < 0:
+                # Indexed while installed, since removed
+                continue
+
             pkg = self.build_item(item)
 
             count += 1
@@ -249,64 +326,172 @@ class EopkgPlugin(ProviderPlugin):
         """ Find all available updates for the currently installed software
             Note: This is incredibly primitive and has no plan facility """
         # This does account for stuff that is set to be replaced
-        pkgs = pisi.api.list_upgradable()
-        for pkgID in pkgs:
-            pkg = self.build_item(pkgID)
+        for old, new in self.find_upgrades():
+            pkg = self.build_item(new)
             storage.add_item(pkg.get_id(), pkg, PopulationFilter.UPDATES)
 
+    def find_upgrades(self):
+        """ Return (installed, candidate) pairs for every pending upgrade.
+            Obsoleted packages are swapped for their replacement, or
+            dropped when nothing replaces them, as the old updates view did
+        """
+        obsoleted = set(pisi.api.list_obsoleted())
+        replaces = pisi.api.list_replaces()
+
+        names = set(replaces.keys())
+        for name in self.installDB.list_installed():
+            index = self.catalog.find(name)
+            if index < 0:
+                continue
+            available = int(self.catalog.get_record(index).release)
+            if available > int(self.installDB.get_version(name)[1]):
+                names.add(name)
+        names = pisi.blacklist.exclude_from(list(names),
+                                            pisi.context.const.blacklist)
+
+        ret = []
+        for name in sorted(names):
+            candidate = name
+            if name in obsoleted or name in replaces:
+                if name not in replaces:
+                    # No valid replacement, skip it
+                    continue
+                candidate = replaces[name][0]
+            if not self.catalog.has_package(candidate):
+                continue
+            ret.append((name, candidate))
+        return ret
+
     def populate_drivers(self, storage, provider):
         """ Handle foreign driver requests """
         pkg = provider.get_package()
         print("eopkg plugin requested to populate drivers on {}".format(pkg))
 
         # This is shitty we need to set up with kernels.
-        if not self.availDB.has_package(pkg):
+        if not self.catalog.has_package(pkg):
             return
         item = self.build_item(pkg)
         storage.add_item(item.get_id(), item, PopulationFilter.DRIVERS)
 
     def build_item(self, name):
-        """ Build a complete item definition """
-        avail = None
+        """ Return the interned item for name, building it if this is the
+            first time it has been requested in the current generation """
+        with self.item_lock:
+            item = self.items.get(name)
+        if item is not None:
+            return item
+
         installed = None
-        if self.availDB.has_package(name):
-            avail = self.availDB.get_package(name)
+        avail = self.catalog.get_package(name)
         if self.installDB.has_package(name):
             installed = self.installDB.get_package(name)
         item = EopkgItem(installed, avail)
         item.parent_plugin = self
 
-        if not avail:
-            return item
-
-        # Try to enhance
-        self.refine_item(item)
-        return item
+        # Someone may have beaten us to it on another thread
+        with self.item_lock:
+            return self.items.setdefault(name, item)
 
     def refine_item(self, item):
-        """ Attempt to add basic refinement to an item """
+        """ Attempt to add basic refinement to an item, called by the item
+            itself when its links are first requested """
         if item.available.partOf == "kernel.drivers":
             name = item.get_name()
             if name.endswith("-current"):
                 name = name[0:-8]
             name32 = name + "-32bit"
-            if self.availDB.has_package(name32):
+            if self.catalog.has_package(name32):
                 item.push_link(ItemLink.ENHANCES, self.build_item(name32))
 
+    def get_download_sizes(self, items):
+        """ Price the downloads for a whole plan in one pass. The package
+            cache is only listed once, and we prefer delta packages against
+            the installed release just like eopkg does. Anything already
+            fully cached costs nothing to download.
+        """
+        ret = dict()
+        cache_dir = None
+        cached = set()
+        try:
+            cache_dir = pisi.context.config.cached_packages_dir()
+            cached = set(os.listdir(cache_dir))
+        except Exception as e:
+            print("Unable to list package cache: {}".format(e))
+        ignore_delta = pisi.context.config.values.general.ignore_delta
+
+        for item in items:
+            pkg_id = item.get_id()
+            if not self.availDB.has_package(pkg_id):
+                ret[pkg_id] = 0
+                continue
+            pkg = self.availDB.get_package(pkg_id)
+            uri = pkg.packageURI
+            size = long(pkg.packageSize or 0)
+
+            # Only use a delta if it applies to what we have installed
+            old = item.installed
+            if old and not ignore_delta and \
+                    old.distribution == pkg.distribution and \
+                    old.distributionRelease == pkg.distributionRelease:
+                delta = pkg.get_delta(int(old.release))
+                if delta:
+                    uri = delta.packageURI
+                    size = long(delta.packageSize or 0)
+
+            filename = os.path.basename(uri)
+            if filename in cached:
+                path = os.path.join(cache_dir, filename)
+                try:
+                    if os.path.getsize(path) == size:
+                        size = 0
+                except OSError:
+                    pass
+            ret[pkg_id] = size
+        return ret
+
+    def reset_plans(self):
+        """ Drop the dependency graph and any memoised plans """
+        with self.plan_lock:
+            self.graph = None
+            self.plans = dict()
+
+    def get_plan(self, subject, op, planner):
+        """ Return the memoised plan for the subject and operation, computing
+            it with planner(graph) if we haven't seen it this generation.
+            Failures are raised as PlanError. """
+        key = (subject, op, self.generation)
+        with self.plan_lock:
+            if key in self.plans:
+                return self.plans[key]
+            if self.graph is None:
+                self.graph = EopkgGraph(self.catalog,
+                                        self.installDB,
+                                        self.compDB)
+            try:
+                plan = planner(self.graph)
+            except pisi.Error as e:
+                raise PlanError(str(e))
+            self.plans[key] = plan
+            return plan
+
     def plan_install_item(self, item):
         """ Plan the installation of a given item """
         trans = Transaction(item)
 
-        # We only install one requested item at a time
-        order = set([item.get_id()])
-        # Now ensure system.base upgrade is present because we satisfy safety
-        order |= upgrade_base(order)
-        # Push the installation set here
-        (pg, pkgs) = plan_install_pkg_names(order)
+        def planner(graph):
+            # Now ensure system.base upgrade is present because we satisfy
+            # safety, and walk the graph for everything we're missing
+            order = [item.get_id()]
+            order.extend(graph.plan_base())
+            pkgs = graph.plan_install(order)
+
+            # If system.base is defined (should be!) put base packages first
+            if self.compDB.has_component("system.base"):
+                pkgs = pisi_helper.reorder_base_packages(pkgs)
 
-        # If system.base is defined (should be!) put base packages first
-        if self.compDB.has_component("system.base"):
-            pkgs = pisi_helper.reorder_base_packages(pkgs)
+            return (pkgs, graph.plan_conflicts(pkgs))
+
+        (pkgs, conflicts) = self.get_plan(item.get_id(), "install", planner)
 
         for name in pkgs:
             if self.installDB.has_package(name):
@@ -317,10 +502,52 @@ class EopkgPlugin(ProviderPlugin):
                 trans.push_installation(self.build_item(name))
 
         # Potential conflict?
-        conflicts = pisi_helper.check_conflicts(pkgs, self.availDB)
-        if conflicts:
-            for name in conflicts:
-                trans.push_removal(self.build_item(name))
+        for name in conflicts:
+            trans.push_removal(self.build_item(name))
+
+        return trans
+
+    def plan_upgrade_item(self, items):
+        """ Plan the upgrade of the given item or list of items, or of every
+            pending update if items is None, as a single transaction """
+        primary = None
+        subject = None
+        if isinstance(items, EopkgItem):
+            primary = items
+            items = [items]
+        if items is not None:
+            subject = tuple(sorted(x.get_id() for x in items))
+        trans = Transaction(primary, plugin=self)
+
+        def planner(graph):
+            pairs = self.find_upgrades()
+            if subject is not None:
+                pairs = [x for x in pairs
+                         if x[0] in subject or x[1] in subject]
+            replaced = [x[0] for x in pairs if x[0] != x[1]]
+
+            # One walk over the graph for the whole set, base first
+            order = [x[1] for x in pairs]
+            order.extend(graph.plan_base())
+            pkgs = graph.plan_install(order)
+            if self.compDB.has_component("system.base"):
+                pkgs = pisi_helper.reorder_base_packages(pkgs)
+
+            conflicts = set(graph.plan_conflicts(pkgs))
+            conflicts.update(replaced)
+            return (pkgs, sorted(conflicts))
+
+        (pkgs, conflicts) = self.get_plan(subject, "upgrade", planner)
+
+        for name in pkgs:
+            if self.installDB.has_package(name):
+                trans.push_upgrade(self.build_item(name))
+            else:
+                # New dependency or replacement package
+                trans.push_installation(self.build_item(name))
+
+        for name in conflicts:
+            trans.push_removal(self.build_item(name))
 
         return trans
 
@@ -329,26 +556,48 @@ class EopkgPlugin(ProviderPlugin):
         trans = Transaction(item)
 
         if not automatic:
-            (pg, pkgs) = plan_remove([item.get_id()])
+            pkgs = self.get_plan(
+                item.get_id(), "remove",
+                lambda graph: graph.plan_remove([item.get_id()]))
         else:
-            (pg, pkgs) = plan_autoremove([item.get_id()])
+            pkgs = self.get_plan(
+                item.get_id(), "autoremove",
+                lambda graph: plan_autoremove([item.get_id()])[1])
 
         for name in pkgs:
             trans.push_removal(self.build_item(name))
 
         return trans
 
-    def spinlock_busy_wait(self):
-        """ Prep us for a new spinlock cycle """
-        print(" -> Prep spinlock")
-        self.operation_blocked = True
+    def begin_job(self, executor, transaction=None):
+        """ Stash executor + transaction for the dbus callbacks, and return
+            the future that will be resolved when COMAR is done with us """
+        self.executor = executor
+        self.trans = transaction
+        self.future = OperationFuture()
+        return self.future
 
-    def spinlock_busy_end(self):
-        """ Wait until we're unblocked basically, with minimal wakes """
-        print(" -> spinlock start")
-        while self.operation_blocked:
-            time.sleep(.500)
-        print(" -> spinlock end")
+    def end_job(self, status, error=None):
+        """ Resolve the current job, allowing the executor to move on """
+        future = self.future
+        self.executor = None
+        self.trans = None
+        self.future = None
+        if future is not None:
+            future.resolve(status, error)
+
+    def run_job(self, future, method, *args):
+        """ Fire the COMAR call, resolving the future early on errors """
+        try:
+            method(*args, timeout=100000)
+        except Exception as e:
+            print("eopkg job failed: {}".format(e))
+            if future is not self.future:
+                return
+            if "PolicyKit" in str(e):
+                self.end_job(OperationStatus.CANCELLED, e)
+            else:
+                self.end_job(OperationStatus.FAILED, e)
 
     def dbus_callback(self, package, signal, args):
         """ eopkg/pisi talked to us via COMAR """
@@ -360,6 +609,8 @@ class EopkgPlugin(ProviderPlugin):
             self.handle_dbus_progress(args)
         elif signal == "finished" or signal is None:
             self.handle_dbus_finished(args)
+        elif signal == "error":
+            self.handle_dbus_error(args)
         elif str(signal).startswith("tr.org.pardus.comar.Comar.PolicyKit"):
             self.handle_dbus_cancelled(args)
 
@@ -392,77 +643,57 @@ class EopkgPlugin(ProviderPlugin):
         else:
             print("Status: {} {}".format(cmd, what))
 
+    def update_operation(self, phase, package):
+        """ Publish which package operation we're on """
+        self.executor.update_progress(
+            phase=phase,
+            package=package,
+            index=min(self.trans.op_counter -
+                      self.trans.count_operations() + 1,
+                      self.trans.op_counter),
+            total=self.trans.op_counter,
+            fraction=self.trans.get_fraction())
+
     def handle_dbus_upgrading(self, what):
         """ Package is now upgrading """
         self.current_package = what
-        self.executor.set_progress_string(_("Upgrading {} ({} / {})").format(
-            self.current_package,
-            self.trans.op_counter - self.trans.count_operations() + 1,
-            self.trans.op_counter,
-        ))
+        self.update_operation(ProgressPhase.UPGRADING, what)
 
     def handle_dbus_upgraded(self, what):
         """ Package was upgraded """
-        self.executor.set_progress_string(_("Upgraded {} ({} / {})").format(
-            self.current_package,
-            self.trans.op_counter - self.trans.count_operations() + 1,
-            self.trans.op_counter,
-        ))
         self.trans.pop_upgrade(self.trans.items[self.current_package])
-        self.executor.set_progress_value(self.trans.get_fraction())
+        self.update_operation(ProgressPhase.UPGRADED, self.current_package)
 
     def handle_dbus_removing(self, what):
         """ Package is now removing """
         self.current_package = what
-        self.executor.set_progress_string(_("Removing {} ({} / {})").format(
-            self.current_package,
-            self.trans.op_counter - self.trans.count_operations() + 1,
-            self.trans.op_counter,
-        ))
+        self.update_operation(ProgressPhase.REMOVING, what)
 
     def handle_dbus_removed(self, what):
         """ Package was removed """
-        self.executor.set_progress_string(_("Removed {} ({} / {})").format(
-            self.current_package,
-            self.trans.op_counter - self.trans.count_operations() + 1,
-            self.trans.op_counter,
-        ))
         self.trans.pop_removal(self.trans.items[self.current_package])
-        self.executor.set_progress_value(self.trans.get_fraction())
+        self.update_operation(ProgressPhase.REMOVED, self.current_package)
 
     def handle_dbus_installing(self, what):
         """ Package is now installing """
         self.current_package = what
-        self.executor.set_progress_string(_("Installing {} ({} / {})").format(
-            self.current_package,
-            self.trans.op_counter - self.trans.count_operations() + 1,
-            self.trans.op_counter,
-        ))
+        self.update_operation(ProgressPhase.INSTALLING, what)
 
     def handle_dbus_installed(self, what):
         """ Package was installed """
-        self.executor.set_progress_string(_("Installed {} ({} / {})").format(
-            self.current_package,
-            self.trans.op_counter - self.trans.count_operations() + 1,
-            self.trans.op_counter,
-        ))
         self.trans.pop_installation(self.trans.items[self.current_package])
-        self.executor.set_progress_value(self.trans.get_fraction())
+        self.update_operation(ProgressPhase.INSTALLED, self.current_package)
 
     def handle_dbus_extracting(self, what):
         self.current_package = what
-        self.executor.set_progress_string(_("Extracting {} ({} / {})").format(
-            self.current_package,
-            self.trans.op_counter - self.trans.count_operations() + 1,
-            self.trans.op_counter,
-        ))
+        self.update_operation(ProgressPhase.EXTRACTING, what)
 
     def handle_dbus_usysconf(self):
-        self.executor.set_progress_string(_("Updating system configuration"))
+        self.executor.update_progress(phase=ProgressPhase.CONFIGURING)
         # TODO: Have bouncing progress
 
     def handle_dbus_repo_update(self):
-        self.executor.set_progress_string(_("Updating repository information"))
+        self.executor.update_progress(phase=ProgressPhase.REFRESHING)
         # TODO: Have bouncing progress
 
     def handle_dbus_progress(self, args):
@@ -482,50 +713,44 @@ class EopkgPlugin(ProviderPlugin):
 
     def handle_dbus_fetching_no_transaction(self, args):
         """ Fetching without a transaction, i.e. eopkg-index """
-        filename = os.path.basename(args[1])
-        speed_number = args[3]
-        speed_label = args[4]
-        speed_string = "{} {}".format(speed_number, speed_label)
         downloaded = args[5]
-        download_size = args[6]
-        fraction = float(downloaded) / float(download_size)
-
-        # Update UI
-        self.executor.set_progress_value(fraction)
-        self.executor.set_progress_string(_("Downloading {} {}").format(
-            filename,
-            speed_string,
-        ))
+        download_size = max(args[6], 1)
+        self.executor.update_progress(
+            phase=ProgressPhase.DOWNLOADING,
+            package=os.path.basename(args[1]),
+            downloaded=downloaded,
+            download_size=download_size,
+            speed=parse_speed(args[3], args[4]),
+            fraction=float(downloaded) / float(download_size))
 
     def handle_dbus_fetching_transaction(self, args):
         """ Fetching *with* a transaction, i.e. downloading packages """
         filename = args[1]
-        # Grab the package name here cuz we don't actually know it
-        filename = pisi.util.parse_package_name(filename)[0]
-        speed_number = args[3]
-        speed_label = args[4]
-        speed_string = "{} {}".format(speed_number, speed_label)
+        # Grab the package name here cuz we don't actually know it. This
+        # fires for every chunk, so only parse new filenames.
+        if filename != self.current_fetch:
+            self.current_fetch = filename
+            self.current_fetch_name = pisi.util.parse_package_name(
+                filename)[0]
         downloaded = args[5]
         download_size = args[6]
 
         # We've now downloaded a package completely
-        total = self.trans.download_current + downloaded
-        if total == 0:
-            total = 1
-
         if downloaded == download_size:
             self.trans.update_downloaded_size(downloaded)
             fraction = self.trans.get_download_fraction()
         else:
-            fraction = float(total) / float(self.trans.download_total)
-
-        # Update UI
-        self.executor.set_progress_value(fraction)
-        progress_string = _("Downloading {} {}".format(
-            filename,
-            speed_string,
-        ))
-        self.executor.set_progress_string(progress_string)
+            total = self.trans.download_current + downloaded
+            download_total = max(self.trans.compute_download_size(), 1)
+            fraction = float(total) / float(download_total)
+
+        self.executor.update_progress(
+            phase=ProgressPhase.DOWNLOADING,
+            package=self.current_fetch_name,
+            downloaded=downloaded,
+            download_size=download_size,
+            speed=parse_speed(args[3], args[4]),
+            fraction=min(fraction, 1.0))
 
     def handle_dbus_finished(self, args):
         """ Handle D-BUS finish, i.e. rebuild caches and such """
@@ -537,104 +762,119 @@ class EopkgPlugin(ProviderPlugin):
             "System.Manager.updateRepository",
             "System.Manager.updateAllRepositories",
         ]
+        repoTypes = [
+            "System.Manager.updateRepository",
+            "System.Manager.updateAllRepositories",
+        ]
         if args and args[0] and args[0] in finishedTypes:
-            # This is where we need to force a rebuild of the context
             print("Finished: {}".format(args[0]))
-            self.rebuild_db()
-            # Unblock spin lock here
-            self.operation_blocked = False
+            # Only new repo data requires a full rebuild of the context,
+            # otherwise we just patch what the transaction touched.
+            if args[0] in repoTypes or not self.trans:
+                self.rebuild_db()
+            else:
+                self.apply_transaction(self.trans)
+            # Wake the executor now
+            self.end_job(OperationStatus.SUCCEEDED)
 
         print("Finished message: {}".format(args))
 
+    def apply_transaction(self, trans):
+        """ Update installed state in place for every package touched by
+            the given transaction, leaving the repo side DBs alone """
+        # invalidate() only drops pisi's singleton, so ask for a new one
+        self.installDB.invalidate()
+        self.installDB = pisi.db.installdb.InstallDB()
+        self.reset_plans()
+        self.merge_installed_search()
+
+        for name in trans.items:
+            with self.item_lock:
+                current = self.items.get(name)
+            installed = None
+            if self.installDB.has_package(name):
+                installed = self.installDB.get_package(name)
+
+            # Planned items may predate a refresh, so patch both
+            trans.items[name].set_installed(installed)
+            if current is not None and current != trans.items[name]:
+                current.set_installed(installed)
+
     def handle_dbus_cancelled(self, args):
         """ Cancellation or failure to authenticate """
         print("Cancellation: {}".format(args))
+        self.end_job(OperationStatus.CANCELLED)
 
-    def install_item(self, executor, transaction):
-        # Stash executor + transaction for dbus callback
-        self.executor = executor
-        self.trans = transaction
+    def handle_dbus_error(self, args):
+        """ COMAR reported the job failed """
+        print("Error: {}".format(args))
+        # Whatever happened, some of the transaction may have applied
+        if self.trans:
+            self.apply_transaction(self.trans)
+        self.end_job(OperationStatus.FAILED, args)
 
+    def install_item(self, executor, transaction):
+        future = self.begin_job(executor, transaction)
         pitem = transaction.primary_item
-        # Guard operation to ensure we complete all ops
-        self.spinlock_busy_wait()
-        self.pmanager.installPackage(pitem.get_id(), timeout=100000)
-        self.spinlock_busy_end()
-
-        # Drop it again
-        self.executor = None
-        self.trans = None
+        self.run_job(future, self.pmanager.installPackage, pitem.get_id())
+        return future
 
     def remove_item(self, executor, transaction):
-        # Stash executor + transaction for dbus callback
-        self.executor = executor
-        self.trans = transaction
-
+        future = self.begin_job(executor, transaction)
         items = ",".join([x.get_id() for x in transaction.removals])
-
-        # Guard operation to ensure we complete all ops
-        self.spinlock_busy_wait()
-        self.pmanager.removePackage(items, timeout=100000)
-        self.spinlock_busy_end()
-
-        # Drop it again
-        self.executor = None
-        self.trans = None
+        self.run_job(future, self.pmanager.removePackage, items)
+        return future
+
+    def upgrade_item(self, executor, transaction):
+        future = self.begin_job(executor, transaction)
+        # eopkg resolves the replacements itself from the replaced names
+        replaces = pisi.api.list_replaces()
+        names = [x.get_id() for x in transaction.upgrades]
+        names.extend(x.get_id() for x in transaction.removals
+                     if x.get_id() in replaces)
+        self.run_job(future, self.pmanager.updatePackage, ",".join(names))
+        return future
 
     def refresh_source(self, executor, source):
         print("Refreshing source: {}".format(source.get_name()))
-        self.executor = executor
-
-        self.spinlock_busy_wait()
-        self.pmanager.updateRepository(source.get_name(), timeout=100000)
-        self.spinlock_busy_end()
-
-        self.executor = None
+        future = self.begin_job(executor)
+        self.run_job(future, self.pmanager.updateRepository,
+                     source.get_name())
+        return future
 
 
-def find_have_data(adb, store):
-    """ Find all packages with AppStream data """
-    ret = []
-
-    for key in adb.list_packages(None):
-        app = store.get_app_by_pkgname(key)
-        if not app:
-            continue
-        # Only want desktop apps here
-        if app.get_kind() != As.AppKind.DESKTOP:
-            continue
-        ret.append(key)
-    return ret
+# Rate units as reported by pisi's fetcher
+SPEED_UNITS = {
+    "B/s": 1,
+    "KB/s": 1024,
+    "MB/s": 1024 ** 2,
+    "GB/s": 1024 ** 3,
+}
 
 
-def filter_packages_by_data(adb, store):
-    """ Return available packages by appdata only """
-    pkgs = find_have_data(adb, store)
-    ret = []
-    for item in pkgs:
-        pkg = adb.get_package(item)
-        ret.append(pkg)
-    return ret
-
-
-def unmangle_date(tstamp):
+def parse_speed(number, label):
+    """ Convert pisi's human readable rate back to bytes per second """
     try:
-        ret = time.strptime(tstamp, "%Y-%m-%d")
-        return ret
-    except Exception:
-        # Probably because old eopkg pspec
-        pass
-    try:
-        ret = time.strptime(tstamp, "%m-%d-%Y")
-        return ret
-    except Exception:
+        return int(float(number) * SPEED_UNITS.get(label, 1))
+    except ValueError:
         return 0
 
 
-def history_sort(pkgA, pkgB):
-    dateA = pkgA.history[0].date
-    dateB = pkgB.history[0].date
-    aa = unmangle_date(dateA)
-    ab = unmangle_date(dateB)
-
-    return cmp(aa, ab)
+def find_recent_apps(catalog, entries):
+    """ Return (date, name) once for every available package shipping a
+        desktop application """
+    ret = []
+    seen = set()
+    for entry in entries:
+        # Only want desktop apps here
+        if not entry.desktop:
+            continue
+        name = entry.pkgname
+        if not name or name in seen:
+            continue
+        seen.add(name)
+        index = catalog.find(name)
+        if index < 0:
+            continue
+        ret.append((catalog.get_date_key(index), name))
+    return ret
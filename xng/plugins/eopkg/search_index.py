@@ -0,0 +1,308 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2017-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+
+from array import array
+import bisect
+import marshal
+import os
+import re
+import threading
+
+from .catalog import encode_field
+
+INDEX_VERSION = 1
+
+# Fields we index, ordered by importance. The field is stored in the low
+# bits of each posting so a package only needs one posting per token.
+FIELD_NAME = 0
+FIELD_APP_NAME = 1
+FIELD_KEYWORD = 2
+FIELD_SUMMARY = 3
+FIELD_DESCRIPTION = 4
+
+FIELD_WEIGHTS = [16, 12, 6, 3, 1]
+FIELD_BITS = 3
+
+# How much a token is worth when matched by prefix or by typo tolerance
+# instead of exactly.
+MATCH_EXACT = 4
+MATCH_PREFIX = 2
+MATCH_FUZZY = 1
+
+# Bonus for the term matching a package name outright
+EXACT_NAME_BONUS = 1000
+
+# Keep expansion bounded so that short prefixes remain cheap
+MAX_EXPANSIONS = 64
+
+# Minimum trigram similarity for a typo-tolerant match
+FUZZY_THRESHOLD = 0.5
+FUZZY_MIN_LENGTH = 4
+
+TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+
+
+def get_search_index_path():
+    """ Return the per-user location of the compiled search index """
+    home = os.path.expanduser("~")
+    return os.path.join(home, ".cache", "solus-sc", "eopkg-search")
+
+
+def tokenize(text):
+    """ Split text into lowercase alphanumeric tokens """
+    return [x for x in TOKEN_SPLIT.split(text.lower()) if x]
+
+
+def trigrams(token):
+    """ Return the set of padded trigrams for a token """
+    padded = "${}$".format(token)
+    return set(padded[i:i + 3] for i in xrange(len(padded) - 2))
+
+
+class EopkgSearchIndex:
+    """ EopkgSearchIndex is an inverted token index over the names,
+        summaries and descriptions of every available package, extended at
+        runtime with AppStream names and keywords.
+
+        The package side is compiled alongside the catalog whenever the
+        repository indexes change, so a query is just a handful of dict and
+        bisect lookups rather than a full scan of the PackageDB. Installed
+        packages that no repository provides are added at runtime.
+
+        Runtime additions may race with queries from other search threads,
+        so both happen under the lock.
+    """
+
+    stamp = None
+    packages = None  # Index to package name
+    package_ids = None  # Package name to index
+    postings = None  # Token to packed array of postings
+    vocabulary = None  # Sorted tokens for prefix matching
+
+    fuzzy_tokens = None  # Tokens eligible for typo tolerance
+    fuzzy_map = None  # Trigram to fuzzy tokens
+
+    appstream_merged = False
+    lock = None
+
+    def __init__(self, stamp, packages, postings, fuzzy_tokens):
+        self.stamp = stamp
+        self.packages = packages
+        self.package_ids = dict((x, i) for i, x in enumerate(packages))
+        self.postings = postings
+        self.vocabulary = sorted(postings.keys())
+        self.fuzzy_tokens = set(fuzzy_tokens)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def open(path):
+        """ Load an existing index from disk """
+        with open(path, "rb") as index_file:
+            (version, stamp, packages, postings, fuzzy) = \
+                marshal.load(index_file)
+        if version != INDEX_VERSION:
+            raise ValueError("Incompatible search index")
+        return EopkgSearchIndex(stamp, packages, postings, fuzzy)
+
+    @staticmethod
+    def compile(stamp, packages):
+        """ Compile the given pisi packages into a new index """
+        names = sorted(encode_field(x.name) for x in packages)
+        ids = dict((x, i) for i, x in enumerate(names))
+        tokens = dict()
+        fuzzy = set()
+
+        for pkg in packages:
+            idx = ids[encode_field(pkg.name)]
+            fields = [
+                (FIELD_NAME, encode_field(pkg.name)),
+                (FIELD_SUMMARY, encode_field(pkg.summary)),
+                (FIELD_DESCRIPTION, encode_field(pkg.description)),
+            ]
+            for field, text in fields:
+                words = tokenize(text)
+                if field == FIELD_NAME:
+                    words.append(text.lower())
+                    fuzzy.update(words)
+                for word in words:
+                    hits = tokens.setdefault(word, dict())
+                    hits[idx] = min(hits.get(idx, field), field)
+
+        postings = dict()
+        for word, hits in tokens.iteritems():
+            packed = array("I", [(x << FIELD_BITS) | hits[x]
+                                 for x in sorted(hits)])
+            postings[word] = packed.tostring()
+        return EopkgSearchIndex(stamp, names, postings, fuzzy)
+
+    @staticmethod
+    def build(path, stamp, packages):
+        """ Compile a new index and atomically replace the one on disk """
+        index = EopkgSearchIndex.compile(stamp, packages)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as index_file:
+                marshal.dump((INDEX_VERSION, index.stamp, index.packages,
+                              index.postings, list(index.fuzzy_tokens)),
+                             index_file)
+            os.rename(tmp_path, path)
+        except Exception as e:
+            print("Unable to store search index {}: {}".format(path, e))
+        return index
+
+    def get_stamp(self):
+        return self.stamp
+
+    def add_posting(self, word, idx, field):
+        """ Add a single runtime posting for the given package index """
+        packed = array("I")
+        if word in self.postings:
+            packed.fromstring(self.postings[word])
+        else:
+            bisect.insort(self.vocabulary, word)
+        packed.append((idx << FIELD_BITS) | field)
+        self.postings[word] = packed.tostring()
+
+    def merge_packages(self, packages):
+        """ Index pisi packages missing from the compiled index, such as
+            local installs. Packages we already know are skipped. """
+        with self.lock:
+            for pkg in packages:
+                name = encode_field(pkg.name)
+                if name in self.package_ids:
+                    continue
+                idx = len(self.packages)
+                self.packages.append(name)
+                self.package_ids[name] = idx
+                fields = [
+                    (FIELD_NAME, name),
+                    (FIELD_SUMMARY, encode_field(pkg.summary)),
+                    (FIELD_DESCRIPTION, encode_field(pkg.description)),
+                ]
+                for field, text in fields:
+                    words = tokenize(text)
+                    if field == FIELD_NAME:
+                        words.append(text.lower())
+                        self.fuzzy_tokens.update(words)
+                    for word in set(words):
+                        self.add_posting(word, idx, field)
+            self.fuzzy_map = None
+
+    def merge_appstream(self, entries):
+        """ Fold AppStream names and keywords from the AppSystem entries for
+            our packages into the index. This only happens once for the
+            lifetime of the index. """
+        with self.lock:
+            if self.appstream_merged:
+                return
+            self.appstream_merged = True
+
+            for entry in entries:
+                idx = self.package_ids.get(entry.pkgname)
+                if idx is None:
+                    continue
+                fields = [(FIELD_APP_NAME, [entry.raw_name])]
+                fields.append((FIELD_KEYWORD, entry.keywords))
+                for field, texts in fields:
+                    for text in texts:
+                        if not text:
+                            continue
+                        for word in tokenize(encode_field(text)):
+                            self.add_posting(word, idx, field)
+                            self.fuzzy_tokens.add(word)
+            self.fuzzy_map = None
+
+    def build_fuzzy_map(self):
+        """ Lazily map trigrams to the tokens eligible for typo tolerance """
+        fuzzy_map = dict()
+        for word in self.fuzzy_tokens:
+            if len(word) < 3:
+                continue
+            for tri in trigrams(word):
+                fuzzy_map.setdefault(tri, []).append(word)
+        self.fuzzy_map = fuzzy_map
+
+    def expand(self, token):
+        """ Return (word, match strength) for every indexed word that
+            could be meant by the given query token """
+        ret = dict()
+        if token in self.postings:
+            ret[token] = MATCH_EXACT
+
+        # Prefix matches
+        start = bisect.bisect_left(self.vocabulary, token)
+        for word in self.vocabulary[start:start + MAX_EXPANSIONS]:
+            if not word.startswith(token):
+                break
+            ret.setdefault(word, MATCH_PREFIX)
+
+        if len(token) < FUZZY_MIN_LENGTH:
+            return ret
+
+        # Typo tolerance through shared trigrams
+        if self.fuzzy_map is None:
+            self.build_fuzzy_map()
+        query = trigrams(token)
+        shared = dict()
+        for tri in query:
+            for word in self.fuzzy_map.get(tri, []):
+                shared[word] = shared.get(word, 0) + 1
+        candidates = []
+        for word, count in shared.iteritems():
+            score = 2.0 * count / (len(query) + len(word))
+            if score >= FUZZY_THRESHOLD:
+                candidates.append((-score, word))
+        for score, word in sorted(candidates)[:MAX_EXPANSIONS]:
+            ret.setdefault(word, MATCH_FUZZY)
+        return ret
+
+    def query(self, term):
+        """ Return matching package names, best match first. Every token in
+            the term must match for a package to be returned. """
+        tokens = tokenize(term)
+        if not tokens:
+            return []
+        with self.lock:
+            return self.query_tokens(tokens)
+
+    def query_tokens(self, tokens):
+        """ Rank packages matching every token, under the lock """
+        scores = None
+        for token in tokens:
+            token_scores = dict()
+            for word, strength in self.expand(token).iteritems():
+                packed = array("I")
+                packed.fromstring(self.postings[word])
+                for posting in packed:
+                    idx = posting >> FIELD_BITS
+                    field = posting & ((1 << FIELD_BITS) - 1)
+                    score = FIELD_WEIGHTS[field] * strength
+                    if score > token_scores.get(idx, 0):
+                        token_scores[idx] = score
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = dict((x, scores[x] + y)
+                              for x, y in token_scores.iteritems()
+                              if x in scores)
+            if not scores:
+                return []
+
+        # Typing the exact package name should always win
+        exact = self.package_ids.get("-".join(tokens))
+        if exact is not None and exact in scores:
+            scores[exact] += EXACT_NAME_BONUS
+
+        ranked = sorted(scores.iteritems(),
+                        key=lambda x: (-x[1], self.packages[x[0]]))
+        return [self.packages[x[0]] for x in ranked]
@@ -12,6 +12,7 @@
 #
 
 from ..base import ProviderPlugin, ProviderCategory, PopulationFilter
+from ..base import OperationFuture, ProgressPhase
 
 from gi.repository import Flatpak, GLib, Gio
 from gi.repository import AppStreamGlib as As
@@ -137,15 +138,30 @@ class FlatpakPlugin(ProviderPlugin):
         return self.remotes
 
     def refresh_source(self, executor, source):
-        """ For flatpak we sync the remote ref *and* sync AppStream """
-        self.executor = executor
+        """ For flatpak we sync the remote ref *and* sync AppStream
 
-        self.executor.set_progress_string(_("Updating repository information"))
-        self.client.update_remote_sync(source.name, None)
+            Remotes may refresh concurrently, so each refresh talks to its
+            own FlatpakInstallation rather than sharing self.client
+        """
+        future = OperationFuture()
 
-        self.maybe_sync_appstream(executor, source)
+        try:
+            client = Flatpak.Installation.new_system(None)
+            executor.update_progress(phase=ProgressPhase.REFRESHING)
+            client.update_remote_sync(source.name, None)
+
+            self.maybe_sync_appstream(executor, client, source)
+            future.succeed()
+        except Exception as e:
+            print("Failed to refresh {}: {}".format(source.name, e))
+            future.fail(e)
+        return future
+
+    def get_refresh_concurrency(self):
+        """ Remotes are independent so let them refresh in parallel """
+        return 4
 
-    def maybe_sync_appstream(self, executor, source):
+    def maybe_sync_appstream(self, executor, client, source):
         """ Check if appstream data needs updating """
 
         # Do we need appstream data update?
@@ -166,13 +182,12 @@ class FlatpakPlugin(ProviderPlugin):
             print(time_now - modtime)
             return
 
-        self.executor.set_progress_string(_("Updating AppStream data"))
-        self.client.update_appstream_sync(
+        executor.update_progress(phase=ProgressPhase.APPSTREAM)
+        client.update_appstream_sync(
             source.name,
             Flatpak.get_default_arch(),  # Use local architecture
             None)
 
-        self.executor = None
         print("flatpak appstream synced")
 
     def categories(self):
@@ -21,6 +21,7 @@ class ScScreenshotView(Gtk.Box):
 
     fetcher = None
     screen_map = None
+    generation = 0  # Fetcher generation for the current item
 
     image_widget = None
     box_thumbnails = None
@@ -70,10 +71,15 @@ class ScScreenshotView(Gtk.Box):
         """ Bind to the fetcher now it's available """
         self.fetcher = context.fetcher
         self.screen_map = dict()
-        self.fetcher.connect('media-fetched', self.on_media_fetched)
-        self.fetcher.connect('fetch-failed', self.on_fetch_failed)
 
-    def on_media_fetched(self, fetcher, uri, filename, pixbuf):
+    def on_media_ready(self, uri, pixbuf, err):
+        """ Fetcher completed one of our requests """
+        if pixbuf is None:
+            self.on_fetch_failed(uri, err)
+        else:
+            self.on_media_fetched(uri, pixbuf)
+
+    def on_media_fetched(self, uri, pixbuf):
         """ Some media that we asked for has been loaded """
         # Check if its our main preview
         if uri == self.image_widget.uri:
@@ -83,9 +89,12 @@ class ScScreenshotView(Gtk.Box):
             wid = self.screen_map[uri]
             wid.show_image(uri, pixbuf)
             wid.queue_resize()
+            # Stand in for the main image while it's still loading
+            if wid.alt_uri == self.image_widget.uri:
+                self.image_widget.show_preview(pixbuf)
         pixbuf = None
 
-    def on_fetch_failed(self, fetcher, uri, err):
+    def on_fetch_failed(self, uri, err):
         """ We failed to fetch *something* """
         if uri == self.image_widget.uri:
             self.image_widget.show_failed(uri, err)
@@ -108,7 +117,17 @@ class ScScreenshotView(Gtk.Box):
         # Request show of new picture
         self.image_widget.show_loading()
         self.image_widget.uri = thumb.alt_uri
-        self.fetcher.fetch_media(thumb.alt_uri)
+        self.fetch_main(thumb.alt_uri)
+        if thumb.complete:
+            pbuf = self.fetcher.get_decoded(thumb.uri,
+                                            thumb.get_image_size())
+            if pbuf:
+                self.image_widget.show_preview(pbuf)
+
+    def fetch_main(self, uri):
+        """ Fetch the main image at the size we'll show it """
+        self.fetcher.fetch_media(uri, self.on_media_ready, self.generation,
+                                 self.image_widget.get_image_size())
 
     def set_item(self, item):
         # Clean up old thumbnails
@@ -120,6 +139,10 @@ class ScScreenshotView(Gtk.Box):
             del self.screen_map[key]
         self.screen_map = dict()
 
+        # Drop everything we asked for on behalf of the previous item
+        self.fetcher.cancel_generation(self.generation)
+        self.generation = self.fetcher.begin_generation()
+
         # Ask AppSystem for screenshots (AppStream only!)
         id = item.get_id()
         store = item.get_store()
@@ -139,8 +162,12 @@ class ScScreenshotView(Gtk.Box):
         if not default:
             default = screens[0]
         self.image_widget.uri = default.main_uri
-        # Always "fetch", fetcher knows if it exists or not.
-        self.fetcher.fetch_media(default.main_uri)
+
+        # Stand in with the thumbnail if it was prefetched
+        pbuf = self.fetcher.get_decoded(default.thumb_uri,
+                                        apps.get_thumbnail_size())
+        if pbuf is not None:
+            self.image_widget.show_preview(pbuf)
 
         # Set up the screenshot order
         allScreens = [default]
@@ -148,6 +175,8 @@ class ScScreenshotView(Gtk.Box):
 
         # No point showing thumbnails when only one screenshot is available
         if len(allScreens) < 2:
+            # Always "fetch", fetcher knows if it exists or not.
+            self.fetch_main(default.main_uri)
             return
         defaultParent = None
 
@@ -164,9 +193,14 @@ class ScScreenshotView(Gtk.Box):
             preview.get_parent().set_margin_bottom(8)
             self.screen_map[screen.thumb_uri] = preview
 
-        # Now ask the preview to fetch
+        # Now ask the previews to fetch. The default thumbnail goes first
+        # so that it can stand in while the main image loads.
         for screen in allScreens:
-            self.fetcher.fetch_media(screen.thumb_uri)
+            wid = self.screen_map[screen.thumb_uri]
+            self.fetcher.fetch_media(screen.thumb_uri, self.on_media_ready,
+                                     self.generation, wid.get_image_size())
+            if screen == default:
+                self.fetch_main(default.main_uri)
 
         # And now select it
         self.box_thumbnails.select_child(defaultParent)
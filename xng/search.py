@@ -11,7 +11,7 @@
 #  (at your option) any later version.
 #
 
-from gi.repository import Gtk, GObject, Gdk, Pango
+from gi.repository import Gtk, GObject, Pango
 import threading
 
 from .loadpage import ScLoadingPage
@@ -192,11 +192,10 @@ class ScSearchView(Gtk.Box):
         """ Begin performing the search in a threaded fashion """
         print("Searching for term: {}".format(request.get_term()))
 
+        dispatcher = self.context.dispatcher
+
         # Kill existing results
-        Gdk.threads_enter()
-        for child in self.listbox_results.get_children():
-            child.destroy()
-        Gdk.threads_leave()
+        dispatcher.dispatch(self.clear_results)
 
         for plugin in self.context.plugins:
             plugin.populate_storage(
@@ -204,7 +203,13 @@ class ScSearchView(Gtk.Box):
                 PopulationFilter.SEARCH,
                 request)
 
-        GObject.idle_add(self.end_busy)
+        # Runs once every result has been added
+        dispatcher.dispatch(self.end_busy)
+
+    def clear_results(self):
+        """ Remove all results from the view """
+        for child in self.listbox_results.get_children():
+            child.destroy()
 
     def begin_busy(self):
         """" We're about to start searching """
@@ -223,14 +228,10 @@ class ScSearchView(Gtk.Box):
         """ Storage API """
         if popfilter != PopulationFilter.SEARCH:
             return
-        self.add_search_result(item)
+        self.context.dispatcher.dispatch(self.add_search_result, item)
 
     def add_search_result(self, item):
         """ Add a new search result to the view """
-        Gdk.threads_enter()
-
         wid = ScSearchResult(self.context.appsystem, item)
         wid.show_all()
         self.listbox_results.add(wid)
-
-        Gdk.threads_leave()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2013-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 2 of the License, or
+#  (at your option) any later version.
+#
+
+from gi.repository import AppStreamGlib as As
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+
+# Bump whenever the record layout changes so old caches get rebuilt
+CACHE_MAGIC = "SCAS"
+CACHE_VERSION = 1
+
+# magic, version, source stamp, index offset
+HEADER = struct.Struct("<4sI32sQ")
+
+# Where As.StoreLoadFlags.APP_INFO_SYSTEM looks for metadata
+APP_INFO_DIRS = [
+    "/usr/share/app-info",
+    "/var/cache/app-info",
+    "/var/lib/app-info",
+]
+
+# Fields of a cached record
+RECORD_ID = 0
+RECORD_PKGNAMES = 1
+RECORD_NAME = 2
+RECORD_SUMMARY = 3
+RECORD_DESCRIPTION = 4
+RECORD_KEYWORDS = 5
+RECORD_DESKTOP = 6
+RECORD_URLS = 7
+RECORD_DEVELOPER = 8
+RECORD_LAUNCHABLE = 9
+RECORD_ICONS = 10
+RECORD_SCREENSHOTS = 11
+
+URL_KINDS = [
+    As.UrlKind.HOMEPAGE,
+    As.UrlKind.BUGTRACKER,
+    As.UrlKind.DONATION,
+]
+
+
+def get_appstream_cache_path():
+    """ Return the per-user location of the AppStream cache """
+    home = os.path.expanduser("~")
+    return os.path.join(home, ".cache", "solus-sc", "appstream-cache")
+
+
+def appstream_stamp():
+    """ Compute a stamp over the system AppStream metadata so the cache is
+        only rebuilt when something was installed, removed or updated """
+    digest = hashlib.sha256()
+    for base in APP_INFO_DIRS:
+        for subdir in ["xmls", "yaml"]:
+            root = os.path.join(base, subdir)
+            if not os.path.isdir(root):
+                continue
+            for name in sorted(os.listdir(root)):
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                digest.update("{}:{}:{}\n".format(
+                    path, st.st_mtime, st.st_size))
+    return digest.digest()
+
+
+def record_from_app(app):
+    """ Flatten the fields of an As.App we care about into plain types """
+    urls = dict()
+    for kind in URL_KINDS:
+        url = app.get_url_item(kind)
+        if url:
+            urls[int(kind)] = url
+
+    launchable = app.get_launchable_by_kind(As.LaunchableKind.DESKTOP_ID)
+    if launchable is not None:
+        launchable = launchable.get_value()
+
+    icons = []
+    for icon in app.get_icons():
+        icons.append((int(icon.get_kind()),
+                      icon.get_name(),
+                      icon.get_width(),
+                      icon.get_height(),
+                      icon.get_scale(),
+                      icon.get_prefix(),
+                      icon.get_filename()))
+
+    screenshots = []
+    for shot in app.get_screenshots():
+        images = [(x.get_width(), x.get_url()) for x in shot.get_images()]
+        screenshots.append(
+            (shot.get_kind() == As.ScreenshotKind.DEFAULT, images))
+
+    return (
+        app.get_id(),
+        list(app.get_pkgnames()),
+        app.get_name("C"),
+        app.get_comment("C"),
+        app.get_description("C"),
+        list(app.get_keywords("C") or []),
+        app.get_kind() == As.AppKind.DESKTOP,
+        urls,
+        app.get_developer_name("C"),
+        launchable,
+        icons,
+        screenshots,
+    )
+
+
+def icon_from_record(fields):
+    """ Rebuild an As.Icon from the cached icon fields """
+    (kind, name, width, height, scale, prefix, filename) = fields
+    icon = As.Icon.new()
+    icon.set_kind(As.IconKind(kind))
+    if name:
+        icon.set_name(name)
+    icon.set_width(width)
+    icon.set_height(height)
+    icon.set_scale(scale)
+    if prefix:
+        icon.set_prefix(prefix)
+    if filename:
+        icon.set_filename(filename)
+    return icon
+
+
+def build_keys(records):
+    """ Map every lookup key to a record number. Keys are inserted in order
+        of precedence: package name, then ID, then ID without the .desktop
+        suffix. """
+    keys = dict()
+    for i, record in enumerate(records):
+        for pkgname in record[RECORD_PKGNAMES]:
+            keys.setdefault(pkgname, i)
+    for i, record in enumerate(records):
+        keys.setdefault(record[RECORD_ID], i)
+    for i, record in enumerate(records):
+        app_id = record[RECORD_ID]
+        if app_id.endswith(".desktop"):
+            keys.setdefault(app_id[:-len(".desktop")], i)
+    return keys
+
+
+class ScAppStreamCache:
+    """ ScAppStreamCache is a memory-mapped snapshot of just the AppStream
+        fields the Software Center uses, so we don't need to parse all of
+        the system AppStream XML on every launch.
+
+        Each app is an individually marshalled record, and only the small
+        index of offsets and lookup keys is decoded up front.
+    """
+
+    data = None
+    stamp = None
+    offsets = None
+    keys = None
+
+    def __init__(self, data):
+        self.data = data
+        (magic, version, self.stamp, index_offset) = \
+            HEADER.unpack_from(data, 0)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            raise ValueError("Incompatible AppStream cache")
+        (self.offsets, self.keys) = marshal.loads(data[index_offset:])
+
+    @staticmethod
+    def open(path):
+        """ Memory-map an existing cache from disk """
+        with open(path, "rb") as cache_file:
+            data = mmap.mmap(cache_file.fileno(), 0,
+                             access=mmap.ACCESS_READ)
+        return ScAppStreamCache(data)
+
+    @staticmethod
+    def compile(stamp, records):
+        """ Serialise the records into the cache format """
+        blobs = []
+        offsets = []
+        offset = HEADER.size
+        for record in records:
+            blob = marshal.dumps(record)
+            offsets.append((offset, len(blob)))
+            blobs.append(blob)
+            offset += len(blob)
+        index = marshal.dumps((offsets, build_keys(records)))
+        header = HEADER.pack(CACHE_MAGIC, CACHE_VERSION, stamp, offset)
+        return "".join([header] + blobs + [index])
+
+    @staticmethod
+    def build(path, stamp, records):
+        """ Compile a new cache and atomically replace the one on disk.
+            Failure to write is not fatal, we'll just use it from memory.
+        """
+        data = ScAppStreamCache.compile(stamp, records)
+        tmp_path = path + ".tmp"
+        try:
+            cache_dir = os.path.dirname(path)
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir, 00755)
+            with open(tmp_path, "wb") as cache_file:
+                cache_file.write(data)
+            os.rename(tmp_path, path)
+        except Exception as e:
+            print("Unable to store AppStream cache {}: {}".format(path, e))
+            return ScAppStreamCache(data)
+        return ScAppStreamCache.open(path)
+
+    def get_stamp(self):
+        return self.stamp
+
+    def count(self):
+        return len(self.offsets)
+
+    def find(self, key):
+        """ Return the record number for key, or -1 """
+        return self.keys.get(key, -1)
+
+    def get_record(self, index):
+        """ Decode the record with the given number """
+        (offset, length) = self.offsets[index]
+        return marshal.loads(self.data[offset:offset + length])
@@ -0,0 +1,66 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2013-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 2 of the License, or
+#  (at your option) any later version.
+#
+
+from gi.repository import GLib
+from collections import deque
+import threading
+import time
+
+# Most time spent running queued calls before yielding to the main loop so
+# that it may draw a frame, in seconds
+FRAME_BUDGET = 0.008
+
+
+class ScDispatcher:
+    """ ScDispatcher runs calls queued from any thread on the main loop.
+
+        Rather than taking the global GDK lock for every item, worker
+        threads queue a call for each item, and a single idle source runs
+        them in order in batches of no more than FRAME_BUDGET, so that the
+        UI keeps drawing while a large set of items is being populated.
+    """
+
+    queue = None
+    lock = None
+    source_id = 0
+    budget = FRAME_BUDGET
+
+    def __init__(self, budget=FRAME_BUDGET):
+        self.budget = budget
+        self.queue = deque()
+        self.lock = threading.Lock()
+
+    def dispatch(self, func, *args):
+        """ Queue func(*args) to run on the main loop, after everything
+            else queued so far """
+        with self.lock:
+            self.queue.append((func, args))
+            if self.source_id:
+                return
+            self.source_id = GLib.idle_add(self.drain)
+
+    def drain(self):
+        """ Idle callback, runs queued calls until we're out of time """
+        started = time.time()
+        while True:
+            with self.lock:
+                if not self.queue:
+                    self.source_id = 0
+                    return False
+                (func, args) = self.queue.popleft()
+            try:
+                func(*args)
+            except Exception as e:
+                print("Dispatched call failed: {}".format(e))
+            if time.time() - started >= self.budget:
+                return True
@@ -0,0 +1,253 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2013-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 2 of the License, or
+#  (at your option) any later version.
+#
+
+import httplib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import urlparse
+
+META_SUFFIX = ".meta"
+TEMP_SUFFIX = ".tmp"
+
+# How long a downloaded file is trusted before we revalidate it
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+CONNECT_TIMEOUT = 30
+CHUNK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+
+# Idle connections kept per host
+MAX_IDLE_PER_HOST = 2
+
+USER_AGENT = "solus-sc"
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class ScDownloader:
+    """ ScDownloader fetches HTTP(S) resources straight into a cache
+        directory, reusing keep-alive connections per host.
+
+        The ETag and Last-Modified headers of each download are stored next
+        to it, so that once the TTL expires we only issue a conditional GET
+        and don't transfer anything unless upstream actually changed.
+        Bodies are streamed to a temporary file in the destination directory
+        and atomically renamed into place.
+
+        This has no dependency on GTK so it can be used (and tested) on its
+        own against any HTTP server.
+    """
+
+    ttl = DEFAULT_TTL
+    idle = None  # (scheme, host, port) to idle connections
+    lock = None
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self.idle = dict()
+        self.lock = threading.Lock()
+
+    def get_meta_path(self, path):
+        return path + META_SUFFIX
+
+    def read_meta(self, path):
+        """ Return the stored metadata for a download, or None """
+        try:
+            with open(self.get_meta_path(path), "r") as meta_file:
+                return json.load(meta_file)
+        except (IOError, ValueError):
+            return None
+
+    def write_meta(self, path, meta):
+        meta_path = self.get_meta_path(path)
+        tmp_path = meta_path + TEMP_SUFFIX
+        try:
+            with open(tmp_path, "w") as meta_file:
+                json.dump(meta, meta_file)
+            os.rename(tmp_path, meta_path)
+        except Exception as e:
+            print("Unable to store metadata {}: {}".format(meta_path, e))
+
+    def is_fresh(self, path):
+        """ Determine if path exists and was validated within the TTL """
+        if not os.path.exists(path):
+            return False
+        meta = self.read_meta(path)
+        if meta is None:
+            # Predates revalidation support, trust it for a full TTL
+            meta = dict(checked=time.time())
+            self.write_meta(path, meta)
+            return True
+        return time.time() - meta.get("checked", 0) < self.ttl
+
+    def discard(self, path):
+        """ Remove a bad download along with its metadata, so that the
+            next fetch starts over """
+        for victim in (path, self.get_meta_path(path)):
+            try:
+                os.unlink(victim)
+            except OSError:
+                pass
+
+    def get_connection(self, scheme, host, port):
+        """ Reuse an idle connection to the host if we have one """
+        key = (scheme, host, port)
+        with self.lock:
+            pool = self.idle.get(key)
+            if pool:
+                return (pool.pop(), True)
+        if scheme == "https":
+            conn = httplib.HTTPSConnection(host, port,
+                                           timeout=CONNECT_TIMEOUT)
+        else:
+            conn = httplib.HTTPConnection(host, port,
+                                          timeout=CONNECT_TIMEOUT)
+        return (conn, False)
+
+    def release_connection(self, scheme, host, port, conn):
+        """ Return a connection for reuse once its response is consumed """
+        key = (scheme, host, port)
+        with self.lock:
+            pool = self.idle.setdefault(key, [])
+            if len(pool) < MAX_IDLE_PER_HOST:
+                pool.append(conn)
+                return
+        conn.close()
+
+    def request(self, url, headers):
+        """ Issue a GET, retrying once on a fresh connection if a pooled one
+            turns out to have been closed by the server """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError("Unsupported URL: {}".format(url))
+        port = parts.port
+        if port is None:
+            port = 443 if parts.scheme == "https" else 80
+        target = parts.path or "/"
+        if parts.query:
+            target = "{}?{}".format(target, parts.query)
+        key = (parts.scheme, parts.hostname, port)
+
+        while True:
+            (conn, reused) = self.get_connection(*key)
+            try:
+                conn.request("GET", target, headers=headers)
+                return (key, conn, conn.getresponse())
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                if not reused:
+                    raise
+
+    def fetch(self, url, path, cancellable=None, force=False, sink=None):
+        """ Make sure path holds an up to date copy of url. Returns True if
+            the file was (re)downloaded, and False if the existing copy is
+            still valid.
+
+            If given, sink is called with every chunk of a new download as
+            it arrives, i.e. to decode while we're still downloading. """
+        if not force and self.is_fresh(path):
+            return False
+
+        meta = None
+        if os.path.exists(path):
+            meta = self.read_meta(path)
+
+        for i in range(MAX_REDIRECTS + 1):
+            headers = {"User-Agent": USER_AGENT}
+            if meta and meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta and meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+            (key, conn, response) = self.request(url, headers)
+            status = response.status
+
+            if status in (301, 302, 303, 307, 308):
+                location = response.getheader("location")
+                self.finish_response(key, conn, response)
+                if not location:
+                    raise IOError("Redirect without location for {}".format(
+                        url))
+                url = urlparse.urljoin(url, location)
+                continue
+
+            if status == 304 and meta is not None:
+                self.finish_response(key, conn, response)
+                meta["checked"] = time.time()
+                self.write_meta(path, meta)
+                return False
+
+            if status != 200:
+                self.finish_response(key, conn, response)
+                raise IOError("HTTP {} for {}".format(status, url))
+
+            self.store_response(key, conn, response, path, cancellable,
+                                sink)
+            self.write_meta(path, dict(
+                etag=response.getheader("etag"),
+                last_modified=response.getheader("last-modified"),
+                checked=time.time()))
+            return True
+
+        raise IOError("Too many redirects for {}".format(url))
+
+    def finish_response(self, key, conn, response):
+        """ Drain a response we don't want the body of, keeping the
+            connection alive if possible """
+        try:
+            response.read()
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            return
+        if response.will_close:
+            conn.close()
+        else:
+            self.release_connection(key[0], key[1], key[2], conn)
+
+    def store_response(self, key, conn, response, path, cancellable,
+                       sink=None):
+        """ Stream the body next to path and atomically rename it in """
+        (fd, tmp_path) = tempfile.mkstemp(
+            prefix=".", suffix=TEMP_SUFFIX, dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    if cancellable and cancellable.is_cancelled():
+                        raise DownloadCancelled("Cancelled")
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    if sink:
+                        sink(chunk)
+            # httplib hands back a short body rather than complaining
+            if response.length:
+                raise IOError("Truncated response for {}".format(path))
+            os.rename(tmp_path, path)
+        except Exception:
+            conn.close()
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            self.release_connection(key[0], key[1], key[2], conn)
@@ -12,13 +12,149 @@
 #
 
 
-import Queue
+import itertools
 import multiprocessing
 import threading
-from gi.repository import GObject, GdkPixbuf, Gio, Gdk
+import time
+from gi.repository import GObject, GdkPixbuf, Gio, GLib
 import os
 import hashlib
 
+from .downloader import ScDownloader
+from .lru import ScLruCache
+from .mediacache import ScMediaCache
+from .workers import ScWorkerPool
+
+# Decoded screenshots we're willing to keep around
+DECODED_CACHE_BUDGET = 64 * 1024 * 1024
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Bounds for concurrent downloads. We start in between and let the
+# observed throughput move us.
+MIN_FETCH_WORKERS = 1
+MAX_FETCH_WORKERS = 8
+INITIAL_FETCH_WORKERS = 4
+
+# Decoding is CPU bound, so never go beyond this
+MAX_DECODE_WORKERS = 4
+
+# Prefetches sort after every interactive request, which are keyed by
+# their negated generation
+PREFETCH_PRIORITY = 1
+
+# Most we'll download speculatively within each window, in bytes/seconds
+PREFETCH_BUDGET = 32 * 1024 * 1024
+PREFETCH_WINDOW = 30 * 60
+
+# How often a waiting prefetch checks whether interactive requests are done
+PREFETCH_POLL_INTERVAL = 0.25
+
+
+class ScStreamDecoder:
+    """ Incrementally decode an image with a GdkPixbuf.PixbufLoader one
+        chunk at a time, optionally shrinking it to fit within (width,
+        height) while it is decoded so we never hold the full size image.
+
+        Decoding problems are remembered and raised once from finish().
+        The loader is only created once data arrives, and must then be
+        either finished or aborted.
+    """
+
+    loader = None
+    size = None
+    error = None
+
+    def __init__(self, size=None):
+        self.size = size
+
+    def on_size_prepared(self, loader, width, height):
+        """ Shrink to fit, keeping the aspect ratio. Never upscale. """
+        (max_width, max_height) = self.size
+        if width <= max_width and height <= max_height:
+            return
+        ratio = min(float(max_width) / width, float(max_height) / height)
+        loader.set_size(max(int(width * ratio), 1),
+                        max(int(height * ratio), 1))
+
+    def write(self, chunk):
+        if self.error is not None:
+            return
+        if self.loader is None:
+            self.loader = GdkPixbuf.PixbufLoader()
+            if self.size:
+                self.loader.connect("size-prepared", self.on_size_prepared)
+        try:
+            self.loader.write(chunk)
+        except Exception as e:
+            self.error = e
+
+    def finish(self):
+        """ Return the decoded pixbuf, raising any decode failure """
+        if self.loader is None:
+            raise IOError("No image data")
+        try:
+            self.loader.close()
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+        if self.error is not None:
+            raise self.error
+        return self.loader.get_pixbuf()
+
+    def abort(self):
+        """ Throw away a partial decode """
+        if self.loader is None:
+            return
+        try:
+            self.loader.close()
+        except Exception:
+            pass
+
+
+class ScMediaRequest:
+    """ A handle on a single pending media request. Everyone asking for the
+        same URI shares the request, and each caller's completion callback
+        is bound to the generation of the view that asked so that callers
+        can be cancelled as a group """
+
+    uri = None
+    size = None  # Bounding (width, height) to decode at, or None
+    key = None
+    generation = 0
+    cancellable = None
+    started = False
+    prefetch = False  # Nobody is waiting on it yet
+    callbacks = None  # List of (generation, callback)
+
+    def __init__(self, uri, size=None):
+        self.uri = uri
+        self.size = size
+        self.key = (uri, size)
+        self.cancellable = Gio.Cancellable()
+        self.callbacks = []
+
+    def add_callback(self, generation, callback):
+        self.callbacks.append((generation, callback))
+        self.generation = max(self.generation, generation)
+
+    def remove_generation(self, generation):
+        """ Drop the callbacks for generation, returning True if nobody is
+            interested in the request anymore """
+        self.callbacks = [x for x in self.callbacks if x[0] != generation]
+        if not self.callbacks:
+            # Prefetches only belong to the generation that asked for them
+            return not self.prefetch or self.generation == generation
+        self.generation = max(x[0] for x in self.callbacks)
+        return False
+
+    def cancel(self):
+        """ Cancel the request, including any download or decode in flight """
+        self.cancellable.cancel()
+
+    def is_cancelled(self):
+        return self.cancellable.is_cancelled()
+
 
 class ScMediaFetcher(GObject.Object):
     """ The ScMediaFetcher runs a low priority backround queue for handling
@@ -26,41 +162,61 @@ class ScMediaFetcher(GObject.Object):
         This allows for background fetching of screenshots and handles all
         the blocking, etc.
 
-        We'll limit to a maximum of 2 threads for fetching
-        and we'll very likely only ever use one anyway. This allows us to
-        switch between views with minimal transition pain. For single core
-        systems we limit to 1 thread and avoid context issues.
-
-        In all cases we also run a dedicated load thread, which takes over
-        as the fetch thread routine ends, allowing interleaving of the
-        operations as well as ensuring locally existing files are loaded
-        while fetches are ongoing.
+        Fetching and decoding are separate stages, each with its own pool
+        of workers. The fetch pool widens with the number of pending
+        downloads for as long as the observed throughput per download says
+        the link has room for more, while the decode pool is bounded by the
+        number of CPUs. New downloads are decoded incrementally as they
+        stream in, in the fetch stage. Files we already have only pass
+        briefly through the fetch stage to be revalidated when due, and are
+        then decoded from disk in the decode stage.
+
+        Views ask for a new generation whenever they change what they show,
+        and cancel the previous one. Requests for the newest generation are
+        always served first. Results are handed to the callback given with
+        each request, in a single main loop dispatch per request.
+
+        Images are decoded at the size the caller asked for. Decoded
+        pixbufs are kept in a bounded LRU, so that requests for recently
+        shown media are answered without touching the disk.
+
+        Views may also prefetch media the user is likely to look at next.
+        Prefetches run one at a time, only once no interactive downloads
+        are pending, and are dropped when media fetching is disabled, the
+        network is metered or the prefetch budget is used up. An
+        interactive request for media being prefetched takes it over.
     """
 
-    # The main queue is used to attempt fetching of images
-    queue = None
+    # Pools for the network and decode stages
+    fetch_pool = None
+    decode_pool = None
+    prefetch_pool = None
     cache_lock = None
-    cache = None
+    cache = None  # (URI, size) to pending ScMediaRequest
 
-    # The load queue is dedicated on a single thread to attempting to
-    # read the images
-    load_queue = None
+    generation = 0
+    delivering = None  # Finished requests waiting on the main loop
+    counter = None
+
+    # Decoded pixbufs by (URI, size)
+    decoded = None
+
+    # Keeps the on-disk cache within budget
+    media_cache = None
+    downloader = None
+
+    # Bytes prefetched since the current window started
+    prefetch_spent = 0
+    prefetch_window = 0
 
     can_fetch_media = None
     settings = None
 
-    # Emit media-fetched URL local-URL
-    # or fetch-failed URL error
-    __gsignals__ = {
-        'media-fetched': (GObject.SIGNAL_RUN_FIRST, None,
-                          (str, str, GdkPixbuf.Pixbuf)),
-        'fetch-failed': (GObject.SIGNAL_RUN_FIRST, None,
-                         (str, str)),
-    }
-
     __gtype_name__ = "ScMediaFetcher"
 
-    def __init__(self):
+    def __init__(self, min_fetch=MIN_FETCH_WORKERS,
+                 max_fetch=MAX_FETCH_WORKERS,
+                 max_decode=MAX_DECODE_WORKERS):
         GObject.Object.__init__(self)
         self.can_fetch_media = True
 
@@ -69,12 +225,9 @@ class ScMediaFetcher(GObject.Object):
         self.on_settings_changed(self.settings, "fetch-media")
 
         cpuCount = multiprocessing.cpu_count()
-        if cpuCount < 2:
-            threadCount = 1
-        else:
-            threadCount = 2
-        print("{} threads detected, restricting to {} threads".format(
-            cpuCount, threadCount))
+        decodeCount = min(cpuCount, max_decode)
+        print("{} threads detected, using {}-{} fetch and {} decode "
+              "threads".format(cpuCount, min_fetch, max_fetch, decodeCount))
 
         # Ensure we have a cache directory before we start
         cacheDir = self.get_cache_dir()
@@ -85,25 +238,29 @@ class ScMediaFetcher(GObject.Object):
             print("Check home directory permissions for {}: {}".format(
                 cacheDir, ex))
             pass
+        self.media_cache = ScMediaCache(
+            cacheDir, self.settings.get_int64("media-cache-size"))
+        self.downloader = ScDownloader()
 
         # Set up the basics
         self.cache = dict()
         self.cache_lock = threading.Lock()
-        self.queue = Queue.LifoQueue(0)
-
-        # We'll happily let the threads die if required
-        for i in range(threadCount):
-            t = threading.Thread(target=self.begin_fetch)
-            t.daemon = True
-            t.start()
-
-        # Now start the main read queue
-        self.load_queue = Queue.LifoQueue(0)
-        t = threading.Thread(target=self.begin_load)
-        t.daemon = True
-        t.start()
+        self.decoded = ScLruCache(DECODED_CACHE_BUDGET)
+        self.delivering = set()
+        self.counter = itertools.count()
+        self.fetch_pool = ScWorkerPool("fetch", self.process_fetch,
+                                       min_fetch, max_fetch,
+                                       INITIAL_FETCH_WORKERS)
+        self.decode_pool = ScWorkerPool("decode", self.process_decode,
+                                        1, decodeCount)
+        self.prefetch_pool = ScWorkerPool("prefetch", self.process_prefetch,
+                                          1, 1)
 
     def on_settings_changed(self, s, key, data=None):
+        if key == "media-cache-size":
+            if self.media_cache:
+                self.media_cache.set_budget(s.get_int64(key))
+            return
         if key != "fetch-media":
             return
         self.can_fetch_media = s.get_boolean(key)
@@ -123,110 +280,324 @@ class ScMediaFetcher(GObject.Object):
         """ Return fully qualified local path for the URL """
         return os.path.join(self.get_cache_dir(), self.get_cache_filename(url))
 
-    def is_media_pending(self, uri):
+    def is_media_pending(self, uri, size=None):
         """ Determine if the media is pending before asking for
             it to be fetched
         """
         with self.cache_lock:
-            if uri in self.cache:
+            if (uri, size) in self.cache:
                 return True
         return False
 
-    def load_pixbuf(self, local_file):
-        """ Load the pixbuf itself in the background thread """
-        pbuf = None
+    def load_pixbuf(self, local_file, cancellable=None, size=None):
+        """ Load the pixbuf itself in the background thread, decoding it at
+            no more than size """
+        decoder = ScStreamDecoder(size)
+        inf = Gio.File.new_for_path(local_file)
+        stream = inf.read(cancellable)
         try:
-            pbuf = GdkPixbuf.Pixbuf.new_from_file(local_file)
-        except Exception as e:
-            raise e
-            return None
-        return pbuf
-
-    def fetch_pixbuf(self, uri, local_file):
-        """ Fetch the GdkPixbuf in the background thread so it can be updated
-            immediately in the UI without a secondary load routine
-        """
-        if os.path.exists(local_file):
-            return
+            while True:
+                chunk = stream.read_bytes(READ_CHUNK_SIZE, cancellable)
+                if chunk.get_size() == 0:
+                    break
+                decoder.write(chunk.get_data())
+        finally:
+            stream.close(None)
+        return decoder.finish()
+
+    def fetch_pixbuf(self, uri, local_file, cancellable=None, sink=None):
+        """ Make sure we have an up to date copy of the media on disk, in
+            a fetch worker. A new download is passed to sink as it arrives.
+            Returns True if a new copy was downloaded. """
+        name = os.path.basename(local_file)
+        cached = self.media_cache.contains(name)
+        if cached and not self.can_fetch_media:
+            return False
         if not self.can_fetch_media:
             raise RuntimeError("Media fetching disabled in user settings")
-            return
 
-        # Attempt download to a local location, then finally rename to the
-        # final path
-        inf = Gio.File.new_for_uri(uri)
-        out, ios = Gio.File.new_tmp("solus-sc.XXXXXX")
+        # Download (or revalidate) straight into the cache
         try:
-            inf.copy(out, Gio.FileCopyFlags.OVERWRITE, None, None)
+            changed = self.downloader.fetch(uri, local_file, cancellable,
+                                            sink=sink)
         except Exception as e:
-            raise e
+            if not cached or cancellable and cancellable.is_cancelled():
+                raise e
+            # Keep using what we have until upstream is reachable again
+            print("Failed to revalidate {}: {}".format(uri, e))
+            return False
+        if not changed:
+            return False
+
+        self.media_cache.add(name)
+        return True
+
+    def queue_request(self, pool, request):
+        """ Newer generations go first, then first come first served.
+            Prefetches always go last. """
+        if request.prefetch:
+            priority = PREFETCH_PRIORITY
+        else:
+            priority = -request.generation
+        pool.put((priority, next(self.counter), request))
+
+    def finish_request(self, request, pbuf, error):
+        """ Request is complete, so drop it from the pending set and hand
+            the result over to the main loop """
+        with self.cache_lock:
+            if self.cache.get(request.key) is request:
+                del self.cache[request.key]
+            wanted = (len(request.callbacks) > 0 and
+                      not request.is_cancelled())
+            if wanted:
+                self.delivering.add(request)
+        if wanted:
+            GLib.idle_add(self.deliver, request, pbuf, error)
+
+    def deliver(self, request, pbuf, error):
+        """ Run every callback for the request on the main loop """
+        with self.cache_lock:
+            self.delivering.discard(request)
+            if request.is_cancelled():
+                return False
+            # Callers that moved on have had their callbacks dropped
+            callbacks = [x[1] for x in request.callbacks]
+        for callback in callbacks:
+            callback(request.uri, pbuf, error)
+        return False
+
+    def process_decode(self, item):
+        """ Decode stage, loads images that exist on disk """
+        (_, _, request) = item
+        uri = request.uri
+        if request.is_cancelled():
             return
+        filename = self.get_cache_filename_full(uri)
+        pbuf = None
+        try:
+            pbuf = self.load_pixbuf(filename, request.cancellable,
+                                    request.size)
+        except Exception as e:
+            self.fail_decode(request, filename, e)
+            return
+
+        # Let clients know the media is now ready
+        self.media_cache.touch(os.path.basename(filename))
+        self.complete_request(request, pbuf)
 
-        # Copy temporary over the original
+    def fail_decode(self, request, filename, e):
+        """ The media couldn't be decoded, so stop trusting our copy """
+        if request.is_cancelled():
+            return
+        print("Failed to load pixbuf {}: {}".format(filename, e))
+        self.media_cache.forget(os.path.basename(filename))
+        # Otherwise it'd still look fresh and be decoded again next time
+        self.downloader.discard(filename)
+        self.finish_request(request, None, str(e))
+
+    def complete_request(self, request, pbuf):
+        """ Keep the decoded pixbuf around and deliver it """
+        self.decoded.put(request.key, pbuf,
+                         pbuf.get_rowstride() * pbuf.get_height())
+        self.finish_request(request, pbuf, None)
+
+    def process_fetch(self, item):
+        """ Fetch stage, makes sure the media is on disk, decoding new
+            downloads as they stream in and passing anything else on to
+            the decode stage """
+        # Skip requests we've already started or that were since cancelled
+        (_, _, request) = item
+        with self.cache_lock:
+            if request.started or request.is_cancelled():
+                return
+            request.started = True
+        uri = request.uri
+
+        local_file = self.get_cache_filename_full(uri)
+        decoder = ScStreamDecoder(request.size)
+        started = time.time()
         try:
-            out2 = Gio.File.new_for_path(local_file)
-            out.copy(out2, Gio.FileCopyFlags.OVERWRITE, None, None)
-            out.delete()
+            changed = self.fetch_pixbuf(uri, local_file, request.cancellable,
+                                        decoder.write)
         except Exception as e:
-            out.delete()
-            raise e
-
-    def begin_load(self):
-        """ Handles loading of the images that already exist """
-        while True:
-            uri = self.load_queue.get()
-            filename = self.get_cache_filename_full(uri)
-            pbuf = None
-            try:
-                pbuf = self.load_pixbuf(filename)
-            except Exception as e:
-                pbuf = None
-                print("Failed to load pixbuf {}: {}".format(
-                    filename, e))
-                Gdk.threads_enter()
-                self.emit('fetch-failed', uri, str(e))
-                Gdk.threads_leave()
-
-            # Let clients know the media is now ready
-            if pbuf:
-                Gdk.threads_enter()
-                self.emit('media-fetched', uri, filename, pbuf)
-                Gdk.threads_leave()
-                pbuf = None
-            self.load_queue.task_done()
-
-    def begin_fetch(self):
-        """ Main thread body function, will effectively run forever
-            based on lock conditions
-        """
-        while True:
-            # Grab the next job and wipe from the cache
-            uri = self.queue.get()
-
-            local_file = self.get_cache_filename_full(uri)
-            fail = False
-            try:
-                self.fetch_pixbuf(uri, local_file)
-            except Exception as e:
-                Gdk.threads_enter()
-                self.emit('fetch-failed', uri, str(e))
-                Gdk.threads_leave()
+            decoder.abort()
+            if not request.is_cancelled():
                 print("Failed to fetch {}: {}".format(uri, e))
-                fail = True
+                self.finish_request(request, None, str(e))
+            return
+        if not changed:
+            decoder.abort()
+            self.queue_request(self.decode_pool, request)
+            return
 
-            # Request load on the main load thread
-            if not fail:
-                self.load_queue.put(uri)
+        self.invalidate_decoded(uri)
+        if request.prefetch:
+            self.spend_prefetch(local_file)
+        else:
+            self.record_throughput(local_file, time.time() - started)
+        try:
+            pbuf = decoder.finish()
+        except Exception as e:
+            self.fail_decode(request, local_file, e)
+            return
+        self.complete_request(request, pbuf)
 
-            # Clean up the fetch state
+    def record_throughput(self, local_file, seconds):
+        """ Feed the rate of an interactive download back into the fetch
+            pool. Prefetches run alone on their own pool, so they'd only
+            skew its idea of how much the link can take. """
+        try:
+            nbytes = os.path.getsize(local_file)
+        except OSError:
+            return
+        self.fetch_pool.record_throughput(nbytes, seconds)
+
+    def invalidate_decoded(self, uri):
+        """ The media changed upstream, so every size we decoded from the
+            old copy is stale """
+        self.decoded.remove_if(lambda key: key[0] == uri)
+
+    def process_prefetch(self, item):
+        """ Prefetch stage, waits for interactive downloads to finish and
+            then fetches the media if we're still allowed to """
+        (_, _, request) = item
+        while not request.started and not request.is_cancelled():
+            (workers, active, limit, queued) = self.fetch_pool.get_stats()
+            if active == 0 and queued == 0:
+                break
+            time.sleep(PREFETCH_POLL_INTERVAL)
+
+        if request.prefetch and not self.may_prefetch(request.uri):
             with self.cache_lock:
-                del self.cache[uri]
-            self.queue.task_done()
+                # Someone may have taken it over in the meantime
+                if not request.prefetch:
+                    return
+                if self.cache.get(request.key) is request:
+                    del self.cache[request.key]
+                request.cancel()
+            return
+        self.process_fetch(item)
+
+    def is_network_metered(self):
+        """ Determine if the network connection is billed by usage """
+        monitor = Gio.NetworkMonitor.get_default()
+        try:
+            return monitor.get_network_metered()
+        except AttributeError:
+            # GLib before 2.46
+            return False
+
+    def may_prefetch(self, uri):
+        """ Determine if we're allowed to prefetch the media right now.
+            Anything we already have is fine, as at most it needs a
+            conditional request to revalidate it. """
+        if not self.can_fetch_media:
+            return False
+        if self.media_cache.contains(self.get_cache_filename(uri)):
+            return True
+        if self.is_network_metered():
+            return False
+        with self.cache_lock:
+            if time.time() - self.prefetch_window >= PREFETCH_WINDOW:
+                self.prefetch_window = time.time()
+                self.prefetch_spent = 0
+            return self.prefetch_spent < PREFETCH_BUDGET
 
-    def fetch_media(self, uri):
-        """ Request background fetch of the given media """
-        if self.is_media_pending(uri):
+    def spend_prefetch(self, local_file):
+        """ Charge a prefetch download against the budget """
+        try:
+            nbytes = os.path.getsize(local_file)
+        except OSError:
             return
         with self.cache_lock:
-            self.cache[uri] = True
-        self.queue.put(uri)
+            self.prefetch_spent += nbytes
+
+    def begin_generation(self):
+        """ Return a new generation token for a view to tag requests with.
+            Requests for newer generations jump ahead of older ones. """
+        self.generation += 1
+        return self.generation
+
+    def cancel_generation(self, generation):
+        """ Drop every callback registered for the generation, cancelling
+            any pending or in-flight request that nobody else wants.
+            Requests made without a generation are never cancelled. """
+        if generation == 0:
+            return
+        with self.cache_lock:
+            cancelled = []
+            for request in self.cache.values():
+                if request.remove_generation(generation):
+                    cancelled.append(request)
+                    del self.cache[request.key]
+            for request in cancelled:
+                request.cancel()
+            # Results already on their way to the main loop aren't pending
+            # anymore, but their callers may still have moved on
+            for request in self.delivering:
+                request.remove_generation(generation)
+
+    def get_cache_stats(self):
+        """ Return (hits, misses, entries, bytes used) for decoded media """
+        return self.decoded.get_stats()
+
+    def get_decoded(self, uri, size=None):
+        """ Return the pixbuf for the media if it's already decoded """
+        return self.decoded.get((uri, size))
+
+    def fetch_media(self, uri, callback, generation=0, size=None):
+        """ Request background fetch of the given media. The callback is
+            invoked on the main loop as callback(uri, pixbuf, error), with
+            a None pixbuf and an error string on failure.
+
+            If size is given as (width, height), larger images are shrunk
+            to fit while decoding.
+
+            Returns the ScMediaRequest, or None if the media was already
+            available and the callback has been run immediately.
+        """
+        pbuf = self.decoded.get((uri, size))
+        if pbuf is not None:
+            callback(uri, pbuf, None)
+            return None
+        with self.cache_lock:
+            request = self.cache.get((uri, size))
+            if request is not None:
+                # Already pending, make sure it's served with this generation
+                bump = request.prefetch or generation > request.generation
+                request.prefetch = False
+                request.add_callback(generation, callback)
+                if bump and not request.started:
+                    self.queue_request(self.fetch_pool, request)
+                return request
+            request = ScMediaRequest(uri, size)
+            request.add_callback(generation, callback)
+            self.cache[request.key] = request
+        self.queue_request(self.fetch_pool, request)
+        return request
+
+    def prefetch(self, uri, generation=0, size=None):
+        """ Fetch and decode the media in the background ahead of anyone
+            asking for it, at the lowest priority. The prefetch is dropped
+            when the generation is cancelled, unless an interactive request
+            for the same media was made in the meantime.
+
+            Returns True if the media is already decoded or on its way.
+        """
+        if self.decoded.get((uri, size)) is not None:
+            return True
+        if not self.may_prefetch(uri):
+            return False
+        with self.cache_lock:
+            request = self.cache.get((uri, size))
+            if request is not None:
+                # Keep it alive for the newer view
+                if request.prefetch and request.generation != 0:
+                    request.generation = generation
+                return True
+            request = ScMediaRequest(uri, size)
+            request.prefetch = True
+            request.generation = generation
+            self.cache[request.key] = request
+        self.queue_request(self.prefetch_pool, request)
+        return True
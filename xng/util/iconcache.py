@@ -0,0 +1,45 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2013-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 2 of the License, or
+#  (at your option) any later version.
+#
+
+from gi.repository import AppStreamGlib as As
+import os
+
+# Icon sizes and scale factors the UI renders at
+ICON_SIZES = [64, 128]
+ICON_SCALES = [1, 2]
+
+
+def icon_source_path(icon):
+    """ Work out which file on disk a local or cached As.Icon comes from,
+        without decoding it """
+    kind = icon.get_kind()
+    if kind == As.IconKind.LOCAL:
+        return icon.get_filename()
+    if kind != As.IconKind.CACHED:
+        return None
+    prefix = icon.get_prefix()
+    name = icon.get_name()
+    if not prefix or not name:
+        return None
+    scale = max(icon.get_scale(), 1)
+    width = icon.get_width() / scale
+    height = icon.get_height() / scale
+    candidates = []
+    if scale > 1:
+        candidates.append("{}x{}@{}".format(width, height, scale))
+    candidates.append("{}x{}".format(icon.get_width(), icon.get_height()))
+    for candidate in candidates:
+        path = os.path.join(prefix, candidate, name)
+        if os.path.exists(path):
+            return path
+    return None
@@ -0,0 +1,212 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2013-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 2 of the License, or
+#  (at your option) any later version.
+#
+
+from gi.repository import AppStreamGlib as As
+from gi.repository import GLib, GdkPixbuf, Gdk
+import Queue
+import multiprocessing
+import threading
+
+from solus_sc.icon_cache import ScScaledIconCache
+
+from .appcache import RECORD_ICONS, icon_from_record
+from .iconcache import ICON_SIZES, ICON_SCALES
+from .iconcache import icon_source_path
+from .lru import ScLruCache
+
+# Decoded icons we're willing to keep around
+ICON_CACHE_BUDGET = 32 * 1024 * 1024
+
+MAX_ICON_THREADS = 4
+
+
+def find_icon(icons, width, height):
+    """ AppStream will happily give us remote icons when we'll only look
+        to load locally sourced ones in the icon cache. It will also give
+        us remote ones before a locally existing one so we have to do
+        the iteration ourselves.
+    """
+    for icon in icons:
+        kind = icon.get_kind()
+        if kind == As.IconKind.UNKNOWN or kind == As.IconKind.REMOTE:
+            continue
+        iwidth = icon.get_width() / icon.get_scale()
+        iheight = icon.get_height() / icon.get_scale()
+        if iwidth == width and iheight == height:
+            return icon
+    # Same as As.App.get_icon_for_size
+    for icon in icons:
+        if icon.get_width() == width and icon.get_height() == height:
+            return icon
+    return None
+
+
+def choose_icon(icons, size, scale):
+    """ Pick the icon to display at size for the scale factor, preferring
+        one that needs no scaling """
+    icon = find_icon(icons, size * scale, size * scale)
+    if not icon:
+        icon = find_icon(icons, size, size)
+    if icon:
+        icon.set_scale(scale)
+    return icon
+
+
+class ScIconService:
+    """ ScIconService decodes AppStream icons on a small worker pool so
+        that building large listings never blocks on disk reads or scaling.
+
+        Images are given a placeholder straight away and are updated from
+        the main loop once their icon is ready. Ready icons are kept in an
+        LRU keyed by (app, size, scale factor), and concurrent requests for
+        the same key share a single decode.
+    """
+
+    appsystem = None
+    cache = None
+    scaled = None
+    queue = None
+
+    # Key to the images waiting on it
+    pending = None
+    pending_lock = None
+
+    def __init__(self, appsystem):
+        self.appsystem = appsystem
+        self.cache = ScLruCache(ICON_CACHE_BUDGET)
+        self.scaled = ScScaledIconCache()
+        self.queue = Queue.Queue(0)
+        self.pending = dict()
+        self.pending_lock = threading.Lock()
+
+        threadCount = min(max(multiprocessing.cpu_count() - 1, 1),
+                          MAX_ICON_THREADS)
+        for i in range(threadCount):
+            t = threading.Thread(target=self.begin_decode)
+            t.daemon = True
+            t.start()
+
+    def request(self, image, key, icon, size):
+        """ Show the icon in image at the given pixel size, decoding it in
+            the background if it isn't ready yet """
+        image.sc_icon_key = key
+        ready = self.cache.get(key)
+        if ready is not None:
+            self.apply(image, ready)
+            return
+
+        self.appsystem.set_fallback_icon(image)
+        with self.pending_lock:
+            waiting = self.pending.get(key)
+            if waiting is not None:
+                waiting.append(image)
+                return
+            self.pending[key] = [image]
+        self.queue.put((key, icon, size))
+
+    def begin_decode(self):
+        """ Worker thread body, loads and scales icons forever """
+        while True:
+            (key, icon, size) = self.queue.get()
+            pbuf = None
+            try:
+                pbuf = self.decode(icon, size)
+            except Exception as e:
+                print("Failed to load icon {}: {}".format(key, e))
+            GLib.idle_add(self.deliver, key, pbuf)
+            self.queue.task_done()
+
+    def decode(self, icon, size):
+        """ Load the icon and scale it to size, going through the on-disk
+            cache of pre-scaled icons wherever we know the source file """
+        source = icon_source_path(icon)
+        if source:
+            return self.scaled.load(source, size)
+
+        if not icon.load(As.IconLoadFlags.SEARCH_SIZE):
+            return None
+        pbuf = icon.get_pixbuf()
+
+        # Ensure we upscale on HiDPI
+        if pbuf.get_height() != size:
+            pbuf = pbuf.scale_simple(size, size,
+                                     GdkPixbuf.InterpType.BILINEAR)
+        return pbuf
+
+    def prefill(self, records):
+        """ Scale the icons for the given AppStream cache records in the
+            background, so that later launches never have to """
+        t = threading.Thread(target=self.begin_prefill, args=(records,))
+        t.daemon = True
+        t.start()
+
+    def begin_prefill(self, records):
+        """ Prefill thread body """
+        for record in records:
+            icons = [icon_from_record(x) for x in record[RECORD_ICONS]]
+            for size in ICON_SIZES:
+                for scale in ICON_SCALES:
+                    pixels = size * scale
+                    icon = choose_icon(icons, size, scale)
+                    if not icon or icon.get_width() == pixels:
+                        continue
+                    source = icon_source_path(icon)
+                    if not source or self.scaled.has_icon(source, pixels):
+                        continue
+                    try:
+                        self.scaled.load(source, pixels)
+                    except Exception as e:
+                        print("Failed to scale icon {}: {}".format(source, e))
+
+    def deliver(self, key, pbuf):
+        """ Hand a decoded icon to everyone waiting on it, on the main loop """
+        with self.pending_lock:
+            images = self.pending.pop(key, [])
+
+        ready = None
+        if pbuf is not None:
+            ready = self.prepare(pbuf)
+        if ready is not None:
+            size = pbuf.get_rowstride() * pbuf.get_height()
+            self.cache.put(key, ready, size)
+
+        for image in images:
+            # Widget may have been reused for something else since
+            if getattr(image, "sc_icon_key", None) != key:
+                continue
+            if ready is None:
+                self.appsystem.set_fallback_icon(image)
+            else:
+                self.apply(image, ready)
+        return False
+
+    def prepare(self, pbuf):
+        """ Turn the pixbuf into whatever we can display at our scale """
+        scale = self.appsystem.scale_factor
+        if scale == 1:
+            return pbuf
+
+        window = self.appsystem.window.get_window()
+        if not window:
+            return None
+        try:
+            return Gdk.cairo_surface_create_from_pixbuf(pbuf, scale, window)
+        except Exception as e:
+            print(e)
+        return None
+
+    def apply(self, image, ready):
+        if isinstance(ready, GdkPixbuf.Pixbuf):
+            image.set_from_pixbuf(ready)
+        else:
+            image.set_from_surface(ready)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2013-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 2 of the License, or
+#  (at your option) any later version.
+#
+
+from collections import OrderedDict
+import threading
+
+
+class ScLruCache:
+    """ ScLruCache is a thread-safe least recently used cache bounded by a
+        budget in bytes rather than by a number of entries, as the cost of
+        a cached image depends entirely on its dimensions.
+
+        The caller supplies the size of each value when storing it. Values
+        larger than the whole budget are simply not cached.
+    """
+
+    budget = 0
+    used = 0
+    entries = None
+    lock = None
+
+    hits = 0
+    misses = 0
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the value for key and mark it most recently used """
+        with self.lock:
+            try:
+                (value, size) = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.entries[key] = (value, size)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size):
+        """ Store value, evicting the least recently used entries until it
+            fits within the budget """
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.used -= old[1]
+            if size > self.budget:
+                return
+            while self.entries and self.used + size > self.budget:
+                (_, evicted) = self.entries.popitem(last=False)
+                self.used -= evicted[1]
+            self.entries[key] = (value, size)
+            self.used += size
+
+    def remove(self, key):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.used -= old[1]
+
+    def remove_if(self, predicate):
+        """ Remove every entry whose key satisfies predicate """
+        with self.lock:
+            for key in [x for x in self.entries if predicate(x)]:
+                (_, size) = self.entries.pop(key)
+                self.used -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.used = 0
+
+    def get_stats(self):
+        """ Return (hits, misses, entries, bytes used) """
+        with self.lock:
+            return (self.hits, self.misses, len(self.entries), self.used)
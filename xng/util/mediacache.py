@@ -0,0 +1,221 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2013-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 2 of the License, or
+#  (at your option) any later version.
+#
+
+from gi.repository import GLib
+import marshal
+import os
+import re
+import threading
+import time
+
+INDEX_NAME = ".index"
+INDEX_VERSION = 1
+
+# Download metadata lives next to each file and goes along with it
+META_SUFFIX = ".meta"
+TEMP_SUFFIX = ".tmp"
+
+# Evict down to this fraction of the budget so we don't evict on every add
+LOW_WATERMARK = 0.9
+
+# How often the background thread checks in, in seconds
+SYNC_INTERVAL = 30
+
+# Temporary files from Gio.File.new_tmp("solus-sc.XXXXXX"), as used by
+# the legacy fetcher and previous versions of ours
+TEMP_PATTERN = re.compile(r"^solus-sc\.[A-Za-z0-9]{6}$")
+
+# Leave younger temporary files alone, another instance may own them
+TEMP_MIN_AGE = 60 * 60
+
+
+class ScMediaCache:
+    """ ScMediaCache keeps the on-disk media cache within a byte budget.
+
+        We track the size and last access time of every cached file in an
+        index, which also saves us probing the disk to find out whether
+        something is cached. Files are evicted least recently used first
+        by a background thread, which also persists the index.
+    """
+
+    cache_dir = None
+    index_path = None
+    budget = 0
+    used = 0
+
+    # Filename to [last access, size]
+    index = None
+    lock = None
+    dirty = False
+    wakeup = None
+
+    def __init__(self, cache_dir, budget):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, INDEX_NAME)
+        self.budget = budget
+        self.index = dict()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.load_index()
+
+        t = threading.Thread(target=self.begin_maintenance)
+        t.daemon = True
+        t.start()
+
+    def load_index(self):
+        """ Scan the cache directory, taking access times from the stored
+            index where we have them as atime is often unreliable """
+        stored = dict()
+        try:
+            with open(self.index_path, "rb") as index_file:
+                (version, stored) = marshal.load(index_file)
+            if version != INDEX_VERSION:
+                stored = dict()
+        except Exception:
+            pass
+
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            names = []
+        for name in names:
+            if name == INDEX_NAME or name.endswith(META_SUFFIX):
+                continue
+            if name.endswith(TEMP_SUFFIX):
+                self.sweep_file(os.path.join(self.cache_dir, name))
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            atime = stored.get(name, st.st_mtime)
+            self.index[name] = [atime, st.st_size]
+            self.used += st.st_size
+
+    def save_index(self):
+        """ Atomically write out the access times """
+        with self.lock:
+            stored = dict((x, y[0]) for x, y in self.index.iteritems())
+            self.dirty = False
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as index_file:
+                marshal.dump((INDEX_VERSION, stored), index_file)
+            os.rename(tmp_path, self.index_path)
+        except Exception as e:
+            print("Unable to store media index: {}".format(e))
+
+    def set_budget(self, budget):
+        with self.lock:
+            self.budget = budget
+        self.wakeup.set()
+
+    def contains(self, name):
+        with self.lock:
+            return name in self.index
+
+    def touch(self, name):
+        """ Record an access to a cached file """
+        with self.lock:
+            entry = self.index.get(name)
+            if entry is None:
+                return
+            entry[0] = time.time()
+            self.dirty = True
+
+    def add(self, name):
+        """ Record a newly cached file, evicting if we're now over budget """
+        try:
+            size = os.stat(os.path.join(self.cache_dir, name)).st_size
+        except OSError:
+            return
+        with self.lock:
+            old = self.index.get(name)
+            if old is not None:
+                self.used -= old[1]
+            self.index[name] = [time.time(), size]
+            self.used += size
+            self.dirty = True
+            if self.used <= self.budget:
+                return
+        self.wakeup.set()
+
+    def forget(self, name):
+        """ A cached file has gone missing or is unusable """
+        with self.lock:
+            old = self.index.pop(name, None)
+            if old is not None:
+                self.used -= old[1]
+                self.dirty = True
+
+    def evict(self):
+        """ Remove the least recently used files until we're comfortably
+            back within the budget """
+        with self.lock:
+            if self.used <= self.budget:
+                return
+            target = int(self.budget * LOW_WATERMARK)
+            oldest = sorted(self.index.iteritems(), key=lambda x: x[1][0])
+            victims = []
+            for name, (atime, size) in oldest:
+                if self.used <= target:
+                    break
+                del self.index[name]
+                self.used -= size
+                victims.append(name)
+            self.dirty = True
+
+        for name in victims:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                os.unlink(path)
+            except OSError as e:
+                print("Failed to evict {}: {}".format(name, e))
+            try:
+                os.unlink(path + META_SUFFIX)
+            except OSError:
+                pass
+
+    def sweep_file(self, path):
+        """ Remove a temporary file if it's been abandoned """
+        try:
+            st = os.lstat(path)
+            if st.st_uid != os.getuid():
+                return
+            if time.time() - st.st_mtime < TEMP_MIN_AGE:
+                return
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def sweep_temp(self):
+        """ Remove temporary downloads orphaned by previous sessions """
+        tmp_dir = GLib.get_tmp_dir()
+        try:
+            names = os.listdir(tmp_dir)
+        except OSError:
+            return
+        for name in names:
+            if TEMP_PATTERN.match(name):
+                self.sweep_file(os.path.join(tmp_dir, name))
+
+    def begin_maintenance(self):
+        """ Background thread body, sweeps once then evicts and saves the
+            index whenever needed """
+        self.sweep_temp()
+        while True:
+            self.evict()
+            if self.dirty:
+                self.save_index()
+            self.wakeup.wait(SYNC_INTERVAL)
+            self.wakeup.clear()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2013-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 2 of the License, or
+#  (at your option) any later version.
+#
+
+from gi.repository import GLib, Gtk
+
+# Wait for scrolling to settle before working out what's visible, in ms
+SETTLE_DELAY = 300
+
+
+class ScScreenshotPrefetcher:
+    """ ScScreenshotPrefetcher warms the default screenshot thumbnail of
+        items while their widgets are on screen, so that the details page
+        can show something straight away.
+
+        Views track the widget representing each item. Whenever one is
+        mapped or its scrolled window moves, we work out which tracked
+        widgets intersect the visible area and prefetch for those under a
+        new generation, dropping whatever was prefetched for the previous
+        set that hasn't started yet.
+    """
+
+    context = None
+    widgets = None  # Tracked widget to item
+    scrollers = None  # Scrolled windows we're watching
+    generation = 0
+    timeout_id = 0
+
+    def __init__(self, context):
+        self.context = context
+        self.widgets = dict()
+        self.scrollers = set()
+
+    def track(self, widget, item):
+        """ Prefetch for item whenever widget is visible """
+        self.widgets[widget] = item
+        widget.connect("map", self.on_map)
+        if widget.get_mapped():
+            self.on_map(widget)
+
+    def clear(self):
+        """ Forget every tracked widget and their pending prefetches """
+        self.widgets = dict()
+        self.context.fetcher.cancel_generation(self.generation)
+        self.generation = 0
+
+    def on_map(self, widget):
+        """ Watch the scrolled window the widget lives in """
+        scroller = widget.get_ancestor(Gtk.ScrolledWindow)
+        if scroller is not None and scroller not in self.scrollers:
+            self.scrollers.add(scroller)
+            for adj in (scroller.get_vadjustment(),
+                        scroller.get_hadjustment()):
+                adj.connect("value-changed", self.on_scrolled)
+        self.queue_update()
+
+    def on_scrolled(self, adj, udata=None):
+        self.queue_update()
+
+    def queue_update(self):
+        if self.timeout_id:
+            return
+        self.timeout_id = GLib.timeout_add(SETTLE_DELAY, self.update)
+
+    def is_visible(self, widget):
+        """ Determine if the widget intersects its scrolled window """
+        if not widget.get_mapped():
+            return False
+        scroller = widget.get_ancestor(Gtk.ScrolledWindow)
+        if scroller is None:
+            return True
+        (ok, x, y) = widget.translate_coordinates(scroller, 0, 0)
+        if not ok:
+            return False
+        return x + widget.get_allocated_width() > 0 and \
+            x < scroller.get_allocated_width() and \
+            y + widget.get_allocated_height() > 0 and \
+            y < scroller.get_allocated_height()
+
+    def update(self):
+        """ Prefetch for everything currently visible """
+        self.timeout_id = 0
+        fetcher = self.context.fetcher
+        appsystem = self.context.appsystem
+        old = self.generation
+        self.generation = fetcher.begin_generation()
+        size = appsystem.get_thumbnail_size()
+
+        for widget, item in self.widgets.items():
+            if not self.is_visible(widget):
+                continue
+            screen = appsystem.get_default_screenshot(item.get_id(),
+                                                      item.get_store())
+            if not screen or not screen.thumb_uri:
+                continue
+            if not fetcher.prefetch(screen.thumb_uri, self.generation, size):
+                # Disallowed for now, try again on the next change
+                break
+
+        fetcher.cancel_generation(old)
+        return False
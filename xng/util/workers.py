@@ -0,0 +1,144 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  This file is part of solus-sc
+#
+#  Copyright © 2013-2020 Solus
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 2 of the License, or
+#  (at your option) any later version.
+#
+
+import Queue
+import threading
+
+# Workers above the minimum exit after being idle this long, in seconds
+IDLE_TIMEOUT = 10
+
+# Transfers smaller than this are dominated by latency, so they tell us
+# nothing about the link
+MIN_SAMPLE_BYTES = 32 * 1024
+
+# A transfer slower than this fraction of the best recent per-transfer
+# rate means the link is saturated, while one above the healthy fraction
+# means there's room for another concurrent transfer.
+SATURATED_RATIO = 0.5
+HEALTHY_RATIO = 0.8
+
+# How quickly the best recent rate forgets old samples
+PEAK_DECAY = 0.95
+
+
+class ScWorkerPool:
+    """ ScWorkerPool runs jobs from a priority queue on a number of threads
+        that grows with the queue depth and shrinks again when idle, always
+        staying between the minimum and the current limit.
+
+        The limit starts out between the bounds and may be adapted from the
+        throughput of completed jobs with record_throughput, so that network
+        bound pools only widen while extra transfers actually help.
+    """
+
+    name = None
+    handler = None
+    queue = None
+    lock = None
+
+    min_workers = 1
+    max_workers = 1
+    limit = 1
+
+    workers = 0
+    idle = 0
+    active = 0
+    peak_rate = 0.0
+
+    def __init__(self, name, handler, min_workers, max_workers, limit=None):
+        self.name = name
+        self.handler = handler
+        self.min_workers = max(min_workers, 1)
+        self.max_workers = max(max_workers, self.min_workers)
+        if limit is None:
+            limit = self.max_workers
+        self.limit = min(max(limit, self.min_workers), self.max_workers)
+        self.queue = Queue.PriorityQueue(0)
+        self.lock = threading.Lock()
+
+        for i in range(self.min_workers):
+            self.spawn()
+
+    def spawn(self):
+        with self.lock:
+            self.workers += 1
+            self.idle += 1
+        t = threading.Thread(target=self.run)
+        t.daemon = True
+        t.start()
+
+    def put(self, item):
+        """ Queue a job, lowest sorting items first, bringing up another
+            worker if everyone is busy and we're below the limit """
+        self.queue.put(item)
+        with self.lock:
+            grow = self.queue.qsize() > self.idle and \
+                self.workers < self.limit
+        if grow:
+            self.spawn()
+
+    def run(self):
+        """ Worker thread body """
+        while True:
+            try:
+                item = self.queue.get(timeout=IDLE_TIMEOUT)
+            except Queue.Empty:
+                with self.lock:
+                    if self.workers > self.min_workers:
+                        self.workers -= 1
+                        self.idle -= 1
+                        return
+                continue
+
+            with self.lock:
+                self.idle -= 1
+                self.active += 1
+            try:
+                self.handler(item)
+            except Exception as e:
+                print("{} worker failed: {}".format(self.name, e))
+            with self.lock:
+                self.active -= 1
+                self.idle += 1
+                # Shrink to a lowered limit as jobs complete
+                retire = self.workers > self.limit
+                if retire:
+                    self.workers -= 1
+                    self.idle -= 1
+            self.queue.task_done()
+            if retire:
+                return
+
+    def record_throughput(self, nbytes, seconds):
+        """ Adapt the limit from the rate of a completed transfer, taking
+            into account how many were running alongside it """
+        if nbytes < MIN_SAMPLE_BYTES or seconds <= 0:
+            return
+        rate = nbytes / seconds
+        with self.lock:
+            concurrent = max(self.active, 1)
+            self.peak_rate = max(self.peak_rate * PEAK_DECAY, rate)
+            if rate < self.peak_rate * SATURATED_RATIO:
+                limit = max(concurrent - 1, self.min_workers)
+            elif rate >= self.peak_rate * HEALTHY_RATIO:
+                limit = min(max(self.limit, concurrent + 1),
+                            self.max_workers)
+            else:
+                return
+            self.limit = limit
+
+    def get_stats(self):
+        """ Return (workers, active, limit, queued) """
+        with self.lock:
+            return (self.workers, self.active, self.limit,
+                    self.queue.qsize())
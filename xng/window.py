@@ -489,6 +489,7 @@ class ScMainWindow(Gtk.ApplicationWindow):
         # to the result yield.
         request = SearchRequest(text)
         request.set_installed_only(self.search_installed_only.get_active())
+        request.set_appsystem(self.context.appsystem)
         self.search.set_search_request(request)
         self.request = request  # Cache for resetting the text
 